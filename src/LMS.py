@@ -1,355 +1,24 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from datetime import datetime, timedelta
-from collections import deque
-import pandas as pd
-import logging
+import argparse
+import logging_setup
+import storage
+from library import Book, Library, LibraryError, User
+from autosave import Autosaver
+import metrics
+from loan_index import OverdueSweeper
+from virtual_table import TableModel, VirtualTable
 
 # Set up logging
-logging.basicConfig(filename='library_management.log', level=logging.INFO, format='%(asctime)s:%(levelname)s:%(message)s')
-
-class TreeNode:
-    def __init__(self, book):
-        self.book = book
-        self.left = None
-        self.right = None
-
-class BookBST:
-    def __init__(self):
-        self.root = None
-
-    def insert(self, book):
-        if self.root is None:
-            self.root = TreeNode(book)
-        else:
-            self._insert(self.root, book)
-
-    def _insert(self, node, book):
-        if book.book_id < node.book.book_id:
-            if node.left is None:
-                node.left = TreeNode(book)
-            else:
-                self._insert(node.left, book)
-        elif book.book_id > node.book.book_id:
-            if node.right is None:
-                node.right = TreeNode(book)
-            else:
-                self._insert(node.right, book)
-
-    def search_by_id(self, book_id):
-        return self._search_by_id(self.root, book_id)
-
-    def _search_by_id(self, node, book_id):
-        if node is None:
-            return None
-        if book_id == node.book.book_id:
-            return node.book
-        elif book_id < node.book.book_id:
-            return self._search_by_id(node.left, book_id)
-        else:
-            return self._search_by_id(node.right, book_id)
-
-    def search_by_title(self, title):
-        return self._search_by_title(self.root, title)
-
-    def _search_by_title(self, node, title):
-        if node is None:
-            return []
-        results = []
-        if title.lower() in node.book.title.lower():
-            results.append(node.book)
-        results += self._search_by_title(node.left, title)
-        results += self._search_by_title(node.right, title)
-        return results
-
-    def search_by_author(self, author):
-        return self._search_by_author(self.root, author)
-
-    def _search_by_author(self, node, author):
-        if node is None:
-            return []
-        results = []
-        if author.lower() in node.book.author.lower():
-            results.append(node.book)
-        results += self._search_by_author(node.left, author)
-        results += self._search_by_author(node.right, author)
-        return results
-
-class Book:
-    def __init__(self, book_id, title, author, copies):
-        self.book_id = book_id
-        self.title = title
-        self.author = author
-        self.copies = copies
-        self.reservations = deque()  # Queue for reservations
-
-    def to_dict(self):
-        return {
-            'book_id': self.book_id,
-            'title': self.title,
-            'author': self.author,
-            'copies': self.copies
-        }
-    
-    @staticmethod
-    def from_dict(data):
-        return Book(
-            book_id=data['book_id'],
-            title=data['title'],
-            author=data['author'],
-            copies=data['copies']
-        )
-
-class User:
-    def __init__(self, user_id, name):
-        self.user_id = user_id
-        self.name = name
-        self.borrowed_books = []
-
-    def to_dict(self):
-        return {
-            'user_id': self.user_id,
-            'name': self.name,
-            'borrowed_books': [(book.to_dict(), date, due_date) for book, date, due_date in self.borrowed_books]
-        }
-
-    @staticmethod
-    def from_dict(data):
-        user = User(
-            user_id=data['user_id'],
-            name=data['name']
-        )
-        user.borrowed_books = [(Book.from_dict(book_data), date, due_date) for book_data, date, due_date in data['borrowed_books']]
-        return user
-
-class OverdueRequest:
-    def __init__(self, user, book, days_overdue):
-        self.user = user
-        self.book = book
-        self.days_overdue = days_overdue
-        self.paid = False  # Track if the overdue fee has been paid
-
-    def to_dict(self):
-        return {
-            'user_id': self.user.user_id,
-            'book_id': self.book.book_id,
-            'days_overdue': self.days_overdue,
-            'paid': self.paid
-        }
-    
-    def calculate_overdue_amount(self, fee_per_day=1):
-        return self.days_overdue * fee_per_day
-    
-class Library:
-    def __init__(self):
-        self.books_by_id = {}
-        self.users = {}
-        self.book_bst = BookBST()
-        self.overdue_requests = []  
-        self.load_data()
-
-    def add_book(self, book):
-        self.books_by_id[book.book_id] = book
-        self.book_bst.insert(book)  # Insert into the BST
-        logging.info(f"Added book: {book.title} (ID: {book.book_id})")
-
-    def add_user(self, user):
-        self.users[user.user_id] = user
-        logging.info(f"Added user: {user.name} (ID: {user.user_id})")
-
-    def search_by_id(self, book_id):
-        return self.books_by_id.get(book_id)
-
-    def borrow_book(self, user_id, book_id):
-        user = self.users.get(user_id)
-        book = self.books_by_id.get(book_id)
-        if user and book:
-            if book in [b[0] for b in user.borrowed_books]:  # Check if book is already borrowed
-                messagebox.showerror("Error", f"Book '{book.title}' is already borrowed.")
-            elif book.copies > 0:
-                book.copies -= 1
-                borrow_date = datetime.now().strftime("%Y-%m-%d")  # Get current date
-                due_date = (datetime.now() + timedelta(days=14)).strftime("%Y-%m-%d")  # Calculate due date
-                user.borrowed_books.append((book, borrow_date, due_date))  # Store book, borrow date, and due date
-                logging.info(f"Borrowed book: {book.title} (ID: {book.book_id}) by user {user.name} (ID: {user.user_id})")
-                messagebox.showinfo("Success", f"You have borrowed '{book.title}' on {borrow_date}. Due date: {due_date}.")
-            else:
-                messagebox.showerror("Error", "Book not available.")
-        else:
-            messagebox.showerror("Error", "User or book not found.")
-
-    def return_book(self, user_id, book_id):
-        user = self.users.get(user_id)
-        book = self.books_by_id.get(book_id)
-        if user and book:
-            for borrowed_book in user.borrowed_books:
-                if borrowed_book[0] == book:
-                    book.copies += 1
-                    borrow_date = borrowed_book[1]
-                    due_date = borrowed_book[2]
-                    return_date = datetime.now().strftime("%Y-%m-%d")
-                    days_overdue = (datetime.strptime(return_date, "%Y-%m-%d") - datetime.strptime(due_date, "%Y-%m-%d")).days
-
-                    if days_overdue > 0:
-                        # Create an overdue request instead of returning the book
-                        overdue_request = OverdueRequest(user, book, days_overdue)
-                        self.overdue_requests.append(overdue_request)
-                        overdue_amount = overdue_request.calculate_overdue_amount()
-                        messagebox.showinfo("Overdue", f"Book '{book.title}' is overdue by {days_overdue} days. "
-                                                        f"The overdue amount is Rs.{overdue_amount}. "
-                                                        f"A return request has been submitted to the admin.")
-                    else:
-                        messagebox.showinfo("Success", f"You have returned '{book.title}'.")
-
-                    user.borrowed_books.remove(borrowed_book)
-
-                    if book.reservations:
-                        next_user_id = book.reservations.popleft()  # Get the next user in the queue
-                        next_user = self.users[next_user_id]
-
-                    logging.info(f"Requested return of overdue book: {book.title} (ID: {book.book_id}) by user {user.name} (ID: {user.user_id})")
-                    return
-        messagebox.showerror("Error", "Book not borrowed or user not found.")
-    
-    def reserve_book(self, user_id, book_id):
-        user = self.users.get(user_id)
-        book = self.books_by_id.get(book_id)
-        if user and book:
-            if book.copies == 0:
-                # Add user to the reservations queue
-                book.reservations.append(user_id)
-                logging.info(f"User     {user.name} (ID: {user.user_id}) reserved book: {book.title} (ID: {book.book_id})")
-
-                # Calculate the tentative available date
-                if book.reservations:
-                    # Find the shortest due date from all borrowed instances of this book
-                    tentative_dates = []
-                    for u_id in book.reservations:
-                        user = self.users.get (u_id)
-                        if user:
-                            for borrowed_book in user.borrowed_books:
-                                if borrowed_book[0] == book:  # Check if this book is borrowed by the user
-                                    tentative_dates.append(datetime.strptime(borrowed_book[2], "%Y-%m-%d"))  # due_date
-
-                    if tentative_dates:
-                        tentative_date = min(tentative_dates)  # Get the earliest due date
-                        tentative_date_str = tentative_date.strftime("%Y-%m-%d")
-                    else:
-                        tentative_date_str = "Available Now"
-
-                    messagebox.showinfo("Book Reserved", f"Book '{book.title}' is reserved for you. Tentative available date: {tentative_date_str}")
-                else:
-                    messagebox.showinfo("Book Reserved", f"Book '{book.title}' is reserved for you. Tentative available date: Available Now")
-            else:
-                messagebox.showerror("Error", "Book is currently available. You can borrow it now.")
-        else:
-            messagebox.showerror("Error", "User or book not found.")
-
-    def mark_request_as_paid(self, request):
-        request.paid = True
-        # Return the book back to the library
-        request.book.copies += 1
-        # Remove the request from the list
-        self.overdue_requests.remove(request)
-        logging.info(f"Overdue request for book '{request.book.title}' marked as paid by user {request.user.name}.")
-
-    def modify_book(self, book_id, new_title, new_author, new_copies):
-        book = self.books_by_id.get(book_id)
-        if book:
-            book.title = new_title
-            book.author = new_author
-            book.copies = new_copies
-            logging.info(f"Modified book: {book.title} (ID: {book.book_id})")
-            messagebox.showinfo("Success", f"Book '{book.title}' modified successfully!")
-        else:
-            messagebox.showerror("Error", "Book not found.")
-
-    def delete_book(self, book_id):
-        if book_id in self.books_by_id:
-            del self.books_by_id[book_id]
-            logging.info(f"Deleted book: {book_id}")
-            messagebox.showinfo("Success", "Book deleted successfully!")
-        else:
-            messagebox.showerror("Error", "Book not found.")
-
-    def delete_user(self, user_id):
-        if user_id in self.users:
-            del self.users[user_id]
-            logging.info(f"Deleted user: {user_id}")
-            messagebox.showinfo("Success", "User deleted successfully!")
-        else:
-            messagebox.showerror("Error", "User not found.")
-
-    def get_all_users(self):
-        return self.users.values()
-
-    def save_data(self):
-        # Save books to an Excel file
-        books_data = {
-            'book_id': [],
-            'title': [],
-            'author': [],
-            'copies': []
-        }
-        for book in self.books_by_id.values():
-            books_data['book_id'].append(book.book_id)
-            books_data['title'].append(book.title)
-            books_data['author'].append(book.author)
-            books_data['copies'].append(book.copies)
-
-        books_df = pd.DataFrame(books_data)
-        books_df.to_excel('books.xlsx', index=False)
-
-        # Save users to an Excel file
-        users_data = {
-            'user_id': [],
-            'name': [],
-            'borrowed_books': []
-        }
-        for user in self.users.values():
-            borrowed_books = ';'.join(f"{book.book_id},{date},{due_date}" for book, date, due_date in user.borrowed_books )
-            users_data['user_id'].append(user.user_id)
-            users_data['name'].append(user.name)
-            users_data['borrowed_books'].append(borrowed_books)
-
-        users_df = pd.DataFrame(users_data)
-        users_df.to_excel('users.xlsx', index=False)
-
-    def load_data(self):
-        try:
-            # Load books from the books.xlsx file
-            books_df = pd.read_excel('books.xlsx')
-            for index, row in books_df.iterrows():
-                # Ensure title and author are treated as strings
-                self.add_book(Book(int(row['book_id']), str(row['title']), str(row['author']), int(row['copies'])))
-
-            # Load users from the users.xlsx file
-            users_df = pd.read_excel('users.xlsx')
-            for index, row in users_df.iterrows():
-                user_id = int(row['user_id'])
-                name = row['name']
-                user = User(user_id, name)
-
-                borrowed_books_data = row['borrowed_books']
-                if pd.notna(borrowed_books_data) and borrowed_books_data != "":
-                    borrowed_books_info = borrowed_books_data.split(';')
-                    for book_info in borrowed_books_info:
-                        parts = book_info.split(',')
-                        if len(parts) == 3:
-                            book_id, borrow_date, due_date = parts
-                            book = self.search_by_id(int(book_id))
-                            if book:
-                                user.borrowed_books.append((book, borrow_date, due_date))
-
-                self.add_user(user)
-
-        except FileNotFoundError:
-            print("No saved data found.")
+logging_setup.configure_logging()
+# Treeview population is timed along with the Library hot paths when metrics are on
+metrics.HOT_PATHS.update({TableModel: ('prepare',), VirtualTable: ('scroll_to',)})
 
 class LibraryApp:
-    def __init__(self, master, library):
+    def __init__(self, master, library, autosaver=None):
         self.master = master
         self.library = library
+        self.autosaver = autosaver
         self.master.title("Library Management System")
         self.master.geometry("800x600") 
         self.master.configure(bg="#f0f0f0")  
@@ -361,6 +30,10 @@ class LibraryApp:
         self.style.configure("TEntry", font=("Arial", 12))
 
         self.user_id = None
+        if autosaver:
+            # Any key or click counts as activity, so the idle autosave waits for a quiet moment
+            self.master.bind_all('<Any-KeyPress>', lambda event: autosaver.touch(), add='+')
+            self.master.bind_all('<Any-ButtonPress>', lambda event: autosaver.touch(), add='+')
         self.main_menu()
 
     def main_menu(self):
@@ -378,9 +51,20 @@ class LibraryApp:
             widget.destroy()
 
     def exit_app(self):
+        self.master.withdraw()  # Close the window right away; the final save runs behind it
+        if self.autosaver:
+            self.autosaver.stop()  # Let a background save in progress finish first
         self.library.save_data()  # Save data before exiting
         self.master.destroy()
 
+    def run_action(self, action, *args):
+        # Runs a Library operation, showing its error instead of raising; returns None on failure
+        try:
+            return action(*args)
+        except LibraryError as error:
+            messagebox.showerror("Error", str(error))
+            return None
+
     def admin_login(self):
         self.clear_window()
         frame = ttk.Frame(self.master)
@@ -410,8 +94,10 @@ class LibraryApp:
         ttk.Button(frame, text="Modify Book", command=self.modify_book, width=20).pack(pady=10)
         ttk.Button(frame, text="Delete Book", command=self.delete_book, width=20).pack(pady=10)
         ttk.Button(frame, text="View Overdue Requests", command=self.view_overdue_requests, width=20).pack(pady=10)
+        ttk.Button(frame, text="Batch Return", command=self.batch_return, width=20).pack(pady=10)
         ttk.Button(frame, text="View Books", command=lambda: self.view_books(self.admin_menu), width=20).pack(pady=10)
         ttk.Button(frame, text="View Users", command=self.view_users, width=20).pack(pady=10)
+        ttk.Button(frame, text="Metrics", command=self.view_metrics, width=20).pack(pady=10)
         ttk.Button(frame, text="Back", command=self.main_menu, width=20).pack(pady=10)
 
     def view_overdue_requests(self):
@@ -421,26 +107,36 @@ class LibraryApp:
 
         ttk.Label(frame, text="Overdue Requests", font=("Arial", 18, "bold")).pack(pady=20)
 
-        columns = ("User  ID", "Book ID", "Days Overdue", "Overdue Amount", "Paid")
+        columns = ("User  ID", "Book ID", "Days Overdue", "Overdue Amount", "Paid", "Status")
         tree = ttk.Treeview(frame, columns=columns, show="headings")
         tree.heading("User  ID", text="User      ID")
         tree.heading("Book ID", text="Book ID")
         tree.heading("Days Overdue", text="Days Overdue")
         tree.heading ("Overdue Amount", text="Overdue Amount")
         tree.heading("Paid", text="Paid ")
+        tree.heading("Status", text="Status")
         tree.pack(expand=True, fill=tk.BOTH, pady= 10)
 
-        for request in self.library.overdue_requests:
-            overdue_amount = request.calculate_overdue_amount()  # Calculate the amount
-            tree.insert("", "end", values=(request.user.user_id, request.book.book_id, request.days_overdue, overdue_amount, request.paid))
+        # Returned requests use their request id as the row id; loans the sweeper found
+        # overdue that are still out cannot be settled yet
+        returned = list(self.library.overdue_requests)
+        outstanding = self.library.outstanding_overdue()
+        amounts = self.library.overdue_amounts(returned + outstanding).tolist()
+        for request, overdue_amount in zip(returned, amounts):
+            tree.insert("", "end", iid=str(request.request_id),
+                        values=(request.user.user_id, request.book.book_id, request.days_overdue, overdue_amount, request.paid, "Returned"))
+        for request, overdue_amount in zip(outstanding, amounts[len(returned):]):
+            tree.insert("", "end", iid=f"out-{request.user.user_id}-{request.book.book_id}",
+                        values=(request.user.user_id, request.book.book_id, request.days_overdue, overdue_amount, request.paid, "Not returned"))
 
         def mark_request_as_paid():
             selected_item = tree.selection()
-            if selected_item:
-                request_index = int(selected_item[0].split('I')[-1]) - 1  
-                request = self.library.overdue_requests[request_index]
-                self.library.mark_request_as_paid(request)
-                messagebox.showinfo("Success", f"Overdue request for book '{request.book.title}' marked as paid.")
+            if selected_item and selected_item[0].startswith('out-'):
+                messagebox.showerror("Error", "This book has not been returned yet.")
+            elif selected_item:
+                request = self.run_action(self.library.settle_overdue, int(selected_item[0]))
+                if request:
+                    messagebox.showinfo("Success", f"Overdue request for book '{request.book.title}' marked as paid.")
                 self.view_overdue_requests()  # Refresh the list after marking as paid
             else:
                 messagebox.showerror("Error", "Please select a request to mark as paid.")
@@ -448,6 +144,109 @@ class LibraryApp:
         ttk.Button(frame , text="Mark as Paid", command=mark_request_as_paid, width=20).pack(pady=10)
         ttk.Button(frame, text="Back", command=self.admin_menu, width=20).pack(pady=10)
         
+    def view_metrics(self):
+        self.clear_window()
+        frame = ttk.Frame(self.master)
+        frame.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
+
+        ttk.Label(frame, text="Metrics", font=("Arial", 18, "bold")).pack(pady=20)
+        state = "on" if metrics.METRICS.enabled else "off (start with --metrics, or enable below)"
+        ttk.Label(frame, text=f"Instrumentation is {state}").pack(pady=5)
+
+        columns = ("Operation", "Calls", "Errors", "Mean ms", "p50 ms", "p99 ms", "Total s")
+        tree = ttk.Treeview(frame, columns=columns, show="headings")
+        for column in columns:
+            tree.heading(column, text=column)
+            tree.column(column, width=90 if column != "Operation" else 220, anchor='w' if column == "Operation" else 'e')
+        tree.pack(expand=True, fill=tk.BOTH, pady=10)
+
+        # p50 and p99 are histogram bucket bounds, so they read as "at most"
+        for op, calls, errors, mean, p50, p99, total in metrics.METRICS.rows():
+            tree.insert("", "end", values=(op, calls, errors, f"{mean * 1000:.3f}", f"{p50 * 1000:g}", f"{p99 * 1000:g}", f"{total:.3f}"))
+
+        def toggle():
+            if metrics.METRICS.enabled:
+                metrics.METRICS.disable()
+            else:
+                metrics.METRICS.enable()
+            self.view_metrics()
+
+        def reset():
+            metrics.METRICS.reset()
+            self.view_metrics()
+
+        ttk.Button(frame, text="Refresh", command=self.view_metrics, width=20).pack(pady=5)
+        ttk.Button(frame, text="Disable" if metrics.METRICS.enabled else "Enable", command=toggle, width=20).pack(pady=5)
+        ttk.Button(frame, text="Reset", command=reset, width=20).pack(pady=5)
+        ttk.Button(frame, text="Back", command=self.admin_menu, width=20).pack(pady=5)
+
+    def batch_return(self):
+        # Check-in cart: scan (or type) book IDs one after another, each followed by Enter,
+        # then return the whole cart in one go
+        self.clear_window()
+        frame = ttk.Frame(self.master)
+        frame.pack(expand=True, fill=tk.BOTH, padx=20, pady=20)
+
+        ttk.Label(frame, text="Batch Return", font=("Arial", 18, "bold")).pack(pady=20)
+        ttk.Label(frame, text="User ID:").pack(pady=5)
+        user_id_entry = ttk.Entry(frame)
+        user_id_entry.pack(pady=5)
+        ttk.Label(frame, text="Scan Book ID:").pack(pady=5)
+        book_id_entry = ttk.Entry(frame)
+        book_id_entry.pack(pady=5)
+
+        columns = ("User ID", "Book ID", "Title", "Status")
+        tree = ttk.Treeview(frame, columns=columns, show="headings")
+        for column in columns:
+            tree.heading(column, text=column)
+        tree.pack(expand=True, fill=tk.BOTH, pady=10)
+        pending = []  # Row ids of scanned books not yet returned
+
+        def scan(event=None):
+            try:
+                user_id, book_id = int(user_id_entry.get()), int(book_id_entry.get())
+            except ValueError:
+                messagebox.showerror("Error", "Please enter a numeric User ID and Book ID.")
+                return
+            book = self.library.books_by_id.get(book_id)
+            row = tree.insert("", "end", values=(user_id, book_id, book.title if book else "", "Pending"))
+            pending.append(row)
+            tree.see(row)
+            book_id_entry.delete(0, tk.END)
+            book_id_entry.focus_set()
+
+        def remove_selected():
+            for row in tree.selection():
+                if row in pending:
+                    pending.remove(row)
+                    tree.delete(row)
+
+        def return_all():
+            if not pending:
+                messagebox.showerror("Error", "Please scan at least one book.")
+                return
+            pairs = [tuple(int(value) for value in tree.item(row)['values'][:2]) for row in pending]
+            items = self.run_action(self.library.return_many, pairs)
+            if items is None:
+                return
+            for row, item in zip(pending, items):
+                if item.error:
+                    status = str(item.error)
+                elif item.result.overdue_request:
+                    status = f"Overdue {item.result.days_overdue} days, Rs.{item.result.overdue_amount}"
+                else:
+                    status = "Returned"
+                tree.set(row, "Status", status)
+            pending.clear()
+            returned = sum(item.result is not None for item in items)
+            messagebox.showinfo("Batch Return", f"{returned} of {len(items)} books returned.")
+
+        book_id_entry.bind('<Return>', scan)  # Barcode scanners end each scan with Enter
+        ttk.Button(frame, text="Add", command=scan, width=20).pack(pady=10)
+        ttk.Button(frame, text="Remove Selected", command=remove_selected, width=20).pack(pady=10)
+        ttk.Button(frame, text="Return All", command=return_all, width=20).pack(pady=10)
+        ttk.Button(frame, text="Back", command=self.admin_menu, width=20).pack(pady=10)
+
     def add_book(self):
         self.clear_window()
         frame = ttk.Frame(self.master)
@@ -548,18 +347,20 @@ class LibraryApp:
 
                     def submit_modify():
                         new_value = new_value_entry.get()
+                        title, author, copies = book.title, book.author, book.copies
                         if modify_option.get() == "Title":
-                            book.title = new_value
+                            title = new_value
                         elif modify_option.get() == "Author":
-                            book.author = new_value
+                            author = new_value
                         elif modify_option.get() == "Copies":
                             try:
-                                book.copies = int(new_value)
+                                copies = int(new_value)
                             except ValueError:
                                 messagebox.showerror("Error", "Invalid input for copies. Please enter a number.")
                                 return
 
-                        messagebox.showinfo("Success", "Book modified successfully!")
+                        if self.run_action(self.library.modify_book, book.book_id, title, author, copies):
+                            messagebox.showinfo("Success", f"Book '{title}' modified successfully!")
                         self.admin_menu()  # Go back to the admin menu after modification
 
                     ttk.Button(frame, text="Submit Modification", command=submit_modify, width=20).pack(pady=10)
@@ -586,7 +387,8 @@ class LibraryApp:
         def submit_delete():
             try:
                 book_id = int(book_id_entry.get())
-                self.library.delete_book(book_id)
+                if self.run_action(self.library.delete_book, book_id):
+                    messagebox.showinfo("Success", "Book deleted successfully!")
                 self.admin_menu()
             except ValueError:
                 messagebox.showerror("Error", "Invalid input. Please enter a valid Book ID.")
@@ -607,7 +409,8 @@ class LibraryApp:
         def submit_delete_user():
             try:
                 user_id = int(user_id_entry.get())
-                self.library.delete_user(user_id)
+                if self.run_action(self.library.delete_user, user_id):
+                    messagebox.showinfo("Success", "User deleted successfully!")
                 self.admin_menu()
             except ValueError:
                 messagebox.showerror("Error", "Invalid input. Please enter a valid User ID.")
@@ -622,19 +425,12 @@ class LibraryApp:
 
         ttk.Label(frame, text="Available Books", font=("Arial", 18, "bold")).pack(pady=20)
 
-        tree = ttk.Treeview(frame, columns=("ID", "Title", "Author", "Copies"), show='headings')
-        tree.heading("ID", text="ID")
-        tree.heading("Title", text="Title")
-        tree.heading("Author", text="Author")
-        tree.heading("Copies", text="Copies")
-        tree.pack(pady=10, fill=tk.BOTH, expand=True)
-
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        scrollbar.pack(side='right', fill='y')
-        tree.configure(yscroll=scrollbar.set)
+        # Only the visible rows are put in the Treeview; the rows are gathered off the main loop
+        def book_rows():
+            return [(book.book_id, book.title, book.author, book.copies) for book in list(self.library.books_by_id.values())]
 
-        for book in self.library.books_by_id.values():
-            tree.insert('', 'end', values=(book.book_id, book.title, book.author, book.copies ))
+        table = VirtualTable(frame, ("ID", "Title", "Author", "Copies"), book_rows)
+        table.pack(pady=10, fill=tk.BOTH, expand=True)
 
         ttk.Button(frame, text="Back", command=back_callback, width=20).pack(pady=10)
 
@@ -645,25 +441,18 @@ class LibraryApp:
 
         ttk.Label(frame, text="Registered Users", font=("Arial", 18, "bold")).pack(pady=20)
 
-        # Create a Treeview to display users
-        tree = ttk.Treeview(frame, columns=("ID", "Name"), show='headings')
-        tree.heading("ID", text="ID")
-        tree.heading("Name", text="Name")
-        tree.pack(pady=10, fill=tk.BOTH, expand=True)
-
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        scrollbar .pack(side='right', fill='y')
-        tree.configure(yscroll=scrollbar.set)
+        # Create a virtualized table to display users
+        def user_rows():
+            return [(user.user_id, user.name) for user in list(self.library.users.values())]
 
-        # Populate the Treeview with user data
-        for user in self.library.users.values():
-            tree.insert('', 'end', values=(user.user_id, user.name))
+        table = VirtualTable(frame, ("ID", "Name"), user_rows)
+        table.pack(pady=10, fill=tk.BOTH, expand=True)
 
         # Function to view borrowed books of the selected user
         def view_selected_user_books():
-            selected_item = tree.selection()
-            if selected_item:
-                user_id = tree.item(selected_item)['values'][0]
+            selected_row = table.selected()
+            if selected_row:
+                user_id = selected_row[0]
                 self.show_user_borrowed_books(user_id)
             else:
                 messagebox.showerror("Error", "Please select a user.")
@@ -703,11 +492,11 @@ class LibraryApp:
 
         # Function to delete a selected user
         def delete_selected_user():
-            selected_item = tree.selection()
-            if selected_item:
-                user_id = tree.item(selected_item)['values'][0]
-                self.library.delete_user(user_id)
-                messagebox.showinfo("Success", "User deleted successfully!")
+            selected_row = table.selected()
+            if selected_row:
+                user_id = selected_row[0]
+                if self.run_action(self.library.delete_user, user_id):
+                    messagebox.showinfo("Success", "User deleted successfully!")
                 self.view_users()  # Refresh the user list
             else:
                 messagebox.showerror("Error", "Please select a user to delete.")
@@ -739,7 +528,7 @@ class LibraryApp:
                 tree.pack(expand=True, fill=tk.BOTH, pady=10)
 
                 # Populate the Treeview with borrowed book data
-                for book, borrow_date, due_date in user.borrowed_books:
+                for book, borrow_date, due_date in user.borrowed_books.values():
                     tree.insert("", "end", values=(book.book_id, book.title, book.author, book.copies, borrow_date, due_date))
             else:
                 ttk.Label(frame, text="This user has no borrowed books.").pack(pady=20)
@@ -796,6 +585,36 @@ class LibraryApp:
         search_entry = ttk.Entry(frame)
         search_entry.pack(pady=5)
 
+        # Live suggestions, refreshed shortly after the user stops typing
+        suggestion_list = tk.Listbox(frame, height=8, width=60)
+        suggestion_list.pack(pady=5)
+        suggestions = []
+        pending = [None]  # id of the scheduled refresh, so a new keystroke can cancel it
+
+        def refresh_suggestions():
+            pending[0] = None
+            if not suggestion_list.winfo_exists():  # The user has already left this screen
+                return
+            field = {"Title": "title", "Author": "author"}.get(search_by.get())
+            suggestions[:] = self.library.suggest(field, search_entry.get(), k=8) if field else []
+            suggestion_list.delete(0, tk.END)
+            for book in suggestions:
+                suggestion_list.insert(tk.END, f"{book.title} - {book.author} (ID: {book.book_id})")
+
+        def on_key_release(event):
+            if pending[0] is not None:
+                self.master.after_cancel(pending[0])
+            pending[0] = self.master.after(150, refresh_suggestions)
+
+        def open_suggestion(event):
+            selected = suggestion_list.curselection()
+            if selected:
+                self.display_search_results([suggestions[selected[0]]])
+
+        search_entry.bind("<KeyRelease>", on_key_release)
+        suggestion_list.bind("<Double-Button-1>", open_suggestion)
+        suggestion_list.bind("<Return>", open_suggestion)
+
         def submit_search():
             search_term = search_entry.get()
             results = []
@@ -805,9 +624,9 @@ class LibraryApp:
                     if book:
                         results.append(book)
                 elif search_by.get() == "Title":
-                    results = self.library.book_bst.search_by_title(search_term)
+                    results = self.library.search_by_title(search_term)
                 elif search_by.get() == "Author":
-                    results = self.library.book_bst.search_by_author(search_term)
+                    results = self.library.search_by_author(search_term)
             except ValueError:
                 messagebox.showerror("Error", "Please enter a valid Book ID.")
             self.display_search_results(results)
@@ -822,49 +641,22 @@ class LibraryApp:
 
         ttk.Label(frame, text="Reserve Status", font=("Arial", 18, "bold")).pack(pady=20)
 
-        # Create a Treeview to display reserve status
-        columns = ("Book ID", "Title", "Author", "Reserve Status", "Tentative Available Date")
-        tree = ttk.Treeview(frame, columns=columns, show='headings')
-        tree.heading("Book ID", text="Book ID")
-        tree.heading("Title", text="Title")
-        tree.heading("Author", text="Author")
-        tree.heading("Reserve Status", text="Reserve Status")
-        tree.heading("Tentative Available Date", text="Tentative Available Date")
-        tree.pack(expand=True, fill=tk.BOTH, pady=10)
-
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        scrollbar.pack(side='right', fill='y')
-        tree.configure(yscroll=scrollbar.set)
+        # Only the user's own reservations are listed, each with its tentative available date
+        user_id = self.user_id
 
-        # Get user's reserved books and display their status
-        user = self.library.users.get(self.user_id)
-        if user:
-            for book in self.library.books_by_id.values():  # Iterate through all books
-                reserve_status = "Available"
-                tentative_date_str = ""  # Default value
-
-                if book.copies == 0:  # If no copies are available
-                    if book.reservations and user.user_id in book.reservations:
-                        reserve_status = "Reserved"
-                        # Calculate the tentative available date
-                        tentative_dates = []
-                        for u_id in book.reservations:
-                            if u_id in self.library.users:
-                                for borrowed_book in self.library.users[u_id].borrowed_books:
-                                    if borrowed_book[0] == book:  # Check if this book is borrowed by the user
-                                        tentative_dates.append(datetime.strptime(borrowed_book[2], "%Y-%m-%d"))  # due_date
-
-                        if tentative_dates:
-                            tentative_date = min(tentative_dates)  # Get the earliest due date
-                            tentative_date_str = tentative_date.strftime("%Y-%m-%d")
-                    else:
-                        reserve_status = "Not Available"  # If no copies and not reserved, mark as not available
-                else:
-                    reserve_status = "Available"  # If copies are available, mark as available
+        def reservation_rows():
+            rows = []
+            for book in self.library.reserved_books(user_id):
+                reserve_status = "Reserved" if book.copies == 0 else "Available"
+                tentative_date_str = self.library.tentative_available_date(book.book_id) if book.copies == 0 else None
+                rows.append((book.book_id, book.title, book.author, reserve_status, tentative_date_str or "N/A"))
+            return rows
 
-                tree.insert("", "end", values=(book.book_id, book.title, book.author, reserve_status, tentative_date_str if tentative_date_str else "N/A"))
+        columns = ("Book ID", "Title", "Author", "Reserve Status", "Tentative Available Date")
+        table = VirtualTable(frame, columns, reservation_rows)
+        table.pack(expand=True, fill=tk.BOTH, pady=10)
 
-        else:
+        if not self.library.reserved_books(user_id):
             ttk.Label(frame, text="You have no reserved books.").pack(pady=20)
 
         ttk.Button(frame, text="Back", command=self.user_menu, width=20).pack(pady=10)
@@ -898,10 +690,15 @@ class LibraryApp:
                 book_id = tree.item(selected_item)['values'][0]
                 book = self.library.books_by_id[book_id]
                 if book.copies > 0:
-                    self.library.borrow_book(self.user_id, book_id)
+                    result = self.run_action(self.library.borrow_book, self.user_id, book_id)
+                    if result:
+                        messagebox.showinfo("Success", f"You have borrowed '{result.book.title}' on {result.borrow_date}. Due date: {result.due_date}.")
                     self.display_search_results(books)  # Refresh the search results after borrowing
                 else:
-                    self.library.reserve_book(self.user_id, book_id)
+                    result = self.run_action(self.library.reserve_book, self.user_id, book_id)
+                    if result:
+                        messagebox.showinfo("Book Reserved", f"Book '{result.book.title}' is reserved for you. "
+                                                             f"Tentative available date: {result.tentative_date or 'Available Now'}")
                     self.display_search_results(books)  # Refresh the search results after reserving
             else:
                 messagebox.showerror("Error", "Please select a book to borrow or reserve.")
@@ -930,7 +727,7 @@ class LibraryApp:
                 tree.heading("Due Date", text="Due Date")
                 tree.pack(expand=True, fill=tk.BOTH, pady=10)
 
-                for book, borrow_date, due_date in borrowed_books:
+                for book, borrow_date, due_date in borrowed_books.values():
                     tree.insert("", "end", values=(book.book_id, book.title, book.author, borrow_date, due_date))
                 
                 # Function to return a selected book
@@ -938,7 +735,13 @@ class LibraryApp:
                     selected_item = tree.selection()
                     if selected_item:
                         book_id = tree.item(selected_item)['values'][0]
-                        self.library.return_book(self.user_id, book_id)
+                        result = self.run_action(self.library.return_book, self.user_id, book_id)
+                        if result and result.overdue_request:
+                            messagebox.showinfo("Overdue", f"Book '{result.book.title}' is overdue by {result.days_overdue} days. "
+                                                            f"The overdue amount is Rs.{result.overdue_amount}. "
+                                                            f"A return request has been submitted to the admin.")
+                        elif result:
+                            messagebox.showinfo("Success", f"You have returned '{result.book.title}'.")
                         self.view_borrowed_books()  # Refresh the list after returning
                     else:
                         messagebox.showerror("Error", "Please select a book to return.")
@@ -950,7 +753,30 @@ class LibraryApp:
         ttk.Button(frame, text="Back", command=self.user_menu, width=20).pack(pady=10)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Library Management System")
+    parser.add_argument('--storage', choices=sorted(storage.BACKENDS), default='journal',
+                        help="where library data is kept (default: %(default)s)")
+    parser.add_argument('--autosave-interval', type=float, default=300,
+                        help="seconds between background saves while there are changes (default: %(default)s)")
+    parser.add_argument('--metrics', action='store_true',
+                        help=f"time the library hot paths and write them to {metrics.PROMETHEUS_FILE}")
+    args = parser.parse_args()
+
+    metrics_writer = None
+    if args.metrics:
+        metrics.METRICS.enable()
+        metrics_writer = metrics.MetricsWriter()
+        metrics_writer.start()
     root = tk.Tk()
-    library = Library ()
-    app = LibraryApp(root, library)
-    root.mainloop()
\ No newline at end of file
+    library = Library(storage_backend=storage.BACKENDS[args.storage]())
+    autosaver = Autosaver(library, interval=args.autosave_interval)
+    app = LibraryApp(root, library, autosaver)
+    autosaver.start()
+    sweeper = OverdueSweeper(library)
+    sweeper.start()
+    root.mainloop()
+    sweeper.stop()
+    autosaver.stop()
+    library.storage.close()
+    if metrics_writer:
+        metrics_writer.stop()
\ No newline at end of file
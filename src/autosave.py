@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+
+
+class Autosaver:
+    # Saves the library on a daemon thread: every interval seconds while there are unsaved
+    # changes, and sooner once nobody has touched the app for idle seconds after a change.
+    # Each save is Library.capture_save (a quick copy with operations locked out) followed
+    # by the slow write, which runs here while the library is already in use again.
+    CHECK_EVERY = 1.0
+
+    def __init__(self, library, interval=300, idle=30):
+        self.library = library
+        self.interval = interval
+        self.idle = idle
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_save = time.monotonic()
+        self._last_activity = time.monotonic()
+        self._full = False  # Set after a failed write; the next save rewrites everything
+
+    def touch(self):
+        # Called on user activity; the idle save waits until the app has been quiet for a while
+        self._last_activity = time.monotonic()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='autosaver', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.CHECK_EVERY):
+            if not (self._full or self.library.dirty_books or self.library.dirty_users):
+                continue
+            now = time.monotonic()
+            if now - self._last_save >= self.interval or now - self._last_activity >= self.idle:
+                self.save_now()
+
+    def save_now(self):
+        start = time.perf_counter()
+        write = self.library.capture_save(self._full)
+        captured = time.perf_counter() - start
+        try:
+            stats = write()
+        except Exception:
+            logging.exception("Autosave failed")
+            self._full = True  # The dirty sets were reset by the capture
+            return None
+        self._full = False
+        self._last_save = time.monotonic()
+        stats.seconds = time.perf_counter() - start
+        self.library.last_save_stats = stats
+        logging.info(f"Autosaved data: {stats}, capture took {captured:.3f} s")
+        return stats
+
+    def stop(self):
+        # Waits for a save in progress, so a final save_data afterwards is the newest on disk
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
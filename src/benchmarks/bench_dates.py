@@ -0,0 +1,79 @@
+# Times the overdue and tentative-availability computations the original way
+# (date strings parsed with strptime on every call, nested loops over users and
+# their loans) against day-ordinal loans and the per-book due-date heaps.
+#
+# Run from the src directory:
+#     python -m benchmarks.bench_dates --books 20000 --loans 200000
+import argparse
+import logging
+import random
+import time
+from datetime import datetime
+
+import dates
+from library import Library
+from benchmarks.bench_load import make_frames
+
+
+def legacy_days_overdue(loans):
+    # return_book formatted now() and parsed it back, then parsed the due date
+    total = 0
+    for book, borrow_date, due_date in loans:
+        return_date = datetime.strptime(datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d")
+        total += (return_date - datetime.strptime(due_date, "%Y-%m-%d")).days
+    return total
+
+
+def ordinal_days_overdue(loans):
+    today = dates.today()
+    return sum(today - loan.due_day for loan in loans)
+
+
+def legacy_available_date(library, book_id):
+    # reserve_book/view_reserve_status scanned every user's loans for the book
+    tentative_dates = []
+    for user in library.users.values():
+        for book, borrow_date, due_date in user.borrowed_books.values():
+            if book.book_id == book_id:
+                tentative_dates.append(datetime.strptime(due_date, "%Y-%m-%d"))
+    return min(tentative_dates).strftime("%Y-%m-%d") if tentative_dates else None
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare string-dated and ordinal-dated overdue/availability computations")
+    parser.add_argument('--books', type=int, default=20_000)
+    parser.add_argument('--loans', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--lookups', type=int, default=20, help="books whose availability is looked up")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    books_df, users_df = make_frames(args.books, args.loans, args.users)
+    library = Library(autoload=False)
+    library.load_books_frame(books_df)
+    library.load_users_frame(users_df)
+    library._rebuild_circulation_indexes()
+    loans = [loan for user in library.users.values() for loan in user.borrowed_books.values()]
+    book_ids = random.Random(1).sample(sorted(library.books_by_id), args.lookups)
+    print(f"{args.books} books, {args.users} users, {len(loans)} loans, {args.lookups} availability lookups")
+
+    for name, legacy, current in (
+        ('days overdue', lambda: legacy_days_overdue(loans), lambda: ordinal_days_overdue(loans)),
+        ('availability', lambda: [legacy_available_date(library, book_id) for book_id in book_ids],
+                         lambda: [library.tentative_available_date(book_id) for book_id in book_ids]),
+    ):
+        legacy_time, legacy_result = timed(legacy)
+        current_time, current_result = timed(current)
+        assert legacy_result == current_result
+        print(f"{name:>13}: strings {legacy_time * 1000:10.1f} ms   ordinals {current_time * 1000:8.2f} ms"
+              f"   ({legacy_time / max(current_time, 1e-9):.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
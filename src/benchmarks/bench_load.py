@@ -0,0 +1,99 @@
+# Compares the original row-by-row load_data loop with the column-wise
+# Library.load_books_frame/load_users_frame path on synthetic data.
+#
+# Run from the src directory:
+#     python -m benchmarks.bench_load --books 100000 --loans 1000000
+#
+# Both paths start from already parsed DataFrames, so the read_excel cost (the
+# same for both) is left out of the comparison. add_book has since gained per-book
+# prefix index maintenance that the original loop never did; the legacy path runs
+# without it and that cost is reported on its own line instead.
+import argparse
+import logging
+import random
+import time
+
+import pandas as pd
+
+from library import Book, Library, User
+from search_index import PrefixIndex
+
+
+def make_frames(num_books, num_loans, num_users, seed=0):
+    rnd = random.Random(seed)
+    books_df = pd.DataFrame({
+        'book_id': range(1, num_books + 1),
+        'title': [f"Title {i}" for i in range(1, num_books + 1)],
+        'author': [f"Author {i % 5000}" for i in range(1, num_books + 1)],
+        'copies': [rnd.randint(0, 10) for _ in range(num_books)],
+    })
+    loans = [[] for _ in range(num_users)]
+    for _ in range(num_loans):
+        loans[rnd.randrange(num_users)].append(f"{rnd.randint(1, num_books)},2024-10-01,2024-10-15")
+    users_df = pd.DataFrame({
+        'user_id': range(1, num_users + 1),
+        'name': [f"User {i}" for i in range(1, num_users + 1)],
+        'borrowed_books': [';'.join(user_loans) for user_loans in loans],
+    })
+    return books_df, users_df
+
+
+def legacy_load(library, books_df, users_df):
+    # The load_data loop as it was before the column-wise path
+    library.prefix_index.add = lambda book: None  # Not part of the original loop; see prefix_insert
+    for index, row in books_df.iterrows():
+        library.add_book(Book(int(row['book_id']), str(row['title']), str(row['author']), int(row['copies'])))
+    for index, row in users_df.iterrows():
+        user = User(int(row['user_id']), row['name'])
+        borrowed_books_data = row['borrowed_books']
+        if pd.notna(borrowed_books_data) and borrowed_books_data != "":
+            for book_info in borrowed_books_data.split(';'):
+                parts = book_info.split(',')
+                if len(parts) == 3:
+                    book_id, borrow_date, due_date = parts
+                    book = library.search_by_id(int(book_id))
+                    if book:
+                        user.borrowed_books[book.book_id] = (book, borrow_date, due_date)
+        library.add_user(user)
+
+
+def prefix_insert(books):
+    # What add_book now spends keeping the prefix index sorted, one insort per book
+    index = PrefixIndex()
+    for book in books:
+        index.add(book)
+
+
+def bulk_load(library, books_df, users_df):
+    library.load_books_frame(books_df)
+    library.load_users_frame(users_df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare row-by-row and column-wise load_data")
+    parser.add_argument('--books', type=int, default=100_000)
+    parser.add_argument('--loans', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # Keep the per-record log lines of the legacy path out of the log file
+    books_df, users_df = make_frames(args.books, args.loans, args.users)
+    print(f"{args.books} books, {args.users} users, {args.loans} loans")
+
+    timings = {}
+    for name, load in (('legacy', legacy_load), ('bulk', bulk_load)):
+        library = Library(autoload=False)
+        start = time.perf_counter()
+        load(library, books_df, users_df)
+        timings[name] = time.perf_counter() - start
+        loans = sum(len(user.borrowed_books) for user in library.users.values())
+        print(f"{name:>8}: {timings[name]:8.2f} s  ({len(library.books_by_id)} books, {loans} loans)")
+        if load is legacy_load:
+            start = time.perf_counter()
+            prefix_insert(library.books_by_id.values())
+            print(f"          + {time.perf_counter() - start:.2f} s for the per-book prefix index inserts add_book does today")
+    print(f"speedup: {timings['legacy'] / timings['bulk']:.1f}x (the bulk time includes building its prefix index)")
+
+
+if __name__ == '__main__':
+    main()
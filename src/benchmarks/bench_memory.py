@@ -0,0 +1,64 @@
+# Reports bytes per book and per loan for the original dict-backed classes
+# (per-book deque, (book, date string, date string) loan tuples) and for the
+# current __slots__ Book/Loan with lazy reservation queues and day ordinals.
+#
+# Run from the src directory:
+#     python -m benchmarks.bench_memory --books 1000000
+import argparse
+import gc
+import tracemalloc
+from collections import deque
+from datetime import date, timedelta
+
+from library import Book, Loan
+
+
+class LegacyBook:
+    def __init__(self, book_id, title, author, copies):
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.copies = copies
+        self.reservations = deque()
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objects, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per book and per loan, before and after __slots__")
+    parser.add_argument('--books', type=int, default=1_000_000)
+    parser.add_argument('--loans', type=int, default=None, help="defaults to the number of books")
+    args = parser.parse_args()
+    loans = args.loans or args.books
+
+    # Titles and authors are shared by both layouts, so they are built outside the measurement
+    titles = [f"Title {i}" for i in range(args.books)]
+    authors = [f"Author {i % 5000}" for i in range(args.books)]
+    start = date(2024, 1, 1)
+
+    print(f"{args.books} books, {loans} loans")
+    for name, book_class in (('before', LegacyBook), ('after', Book)):
+        books, book_bytes = measure(lambda: list(map(book_class, range(args.books), titles, authors, [1] * args.books)))
+        if book_class is LegacyBook:
+            def build_loans():
+                return [(books[i % args.books], (start + timedelta(days=i % 365)).strftime("%Y-%m-%d"),
+                         (start + timedelta(days=i % 365 + 14)).strftime("%Y-%m-%d")) for i in range(loans)]
+        else:
+            def build_loans():
+                return [Loan(books[i % args.books], start.toordinal() + i % 365, start.toordinal() + i % 365 + 14)
+                        for i in range(loans)]
+        loan_objects, loan_bytes = measure(build_loans)
+        print(f"{name:>7}: {book_bytes / args.books:7.1f} bytes/book  {loan_bytes / loans:7.1f} bytes/loan")
+        del books, loan_objects
+
+
+if __name__ == '__main__':
+    main()
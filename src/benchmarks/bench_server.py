@@ -0,0 +1,137 @@
+# Load generator for the HTTP/JSON service mode. Each client holds one keep-alive
+# connection and loops over a mix of title searches, borrows and returns until the
+# time is up; the report gives requests per second and p50/p99 latency.
+#
+# Run from the src directory. Without --port a server is started in a subprocess on
+# a synthetic library in a temporary directory:
+#     python -m benchmarks.bench_server --clients 50 --duration 10
+# or point it at a running server:
+#     python server.py --port 8080 &
+#     python -m benchmarks.bench_server --port 8080 --users 5
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import snapshot
+from library import Library
+from benchmarks.bench_load import make_frames
+
+
+class Client:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            header = await self.reader.readline()
+            if header in (b'\r\n', b''):
+                break
+            name, _, value = header.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        self.writer.close()
+
+
+async def run_client(client_no, args, deadline, latencies, statuses):
+    rnd = random.Random(client_no)
+    client = Client(args.host, args.port)
+    await client.connect()
+    user_id = client_no % args.users + 1
+    borrowed = []
+    try:
+        while time.perf_counter() < deadline:
+            roll = rnd.random()
+            if roll < args.search_ratio:
+                request = ('GET', f"/books?title=Title%20{rnd.randint(1, args.books)}", None)
+            elif borrowed and (roll > 1 - (1 - args.search_ratio) / 2 or len(borrowed) >= 20):
+                request = ('POST', '/return', {'user_id': user_id, 'book_id': borrowed.pop()})
+            else:
+                request = ('POST', '/borrow', {'user_id': user_id, 'book_id': rnd.randint(1, args.books)})
+            start = time.perf_counter()
+            status, body = await client.request(*request)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+            if request[1] == '/borrow' and status == 200:
+                borrowed.append(body['book']['book_id'])
+    finally:
+        client.close()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_load(args):
+    deadline = time.perf_counter() + args.duration
+    latencies = []
+    statuses = Counter()
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(i, args, deadline, latencies, statuses) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    print(f"{len(latencies)} requests from {args.clients} clients in {elapsed:.1f} s: {len(latencies) / elapsed:,.0f} req/s")
+    print(f"latency p50 {percentile(latencies, 0.50) * 1000:.2f} ms, p99 {percentile(latencies, 0.99) * 1000:.2f} ms")
+    print("responses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+
+
+def start_server(args, workdir):
+    # Writes a synthetic snapshot and serves it with the journal backend from workdir
+    books_df, users_df = make_frames(args.books, 0, args.users)
+    library = Library(autoload=False)
+    library.load_books_frame(books_df)
+    library.load_users_frame(users_df)
+    snapshot.save_snapshot(library, os.path.join(workdir, 'library.snapshot'))
+
+    server_py = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server.py')
+    process = subprocess.Popen([sys.executable, server_py, '--port', '0'], cwd=workdir,
+                               stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()  # "Serving on http://host:port"
+    if not line:
+        raise RuntimeError("Server failed to start")
+    args.port = int(line.rsplit(':', 1)[1])
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the library HTTP/JSON server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help="port of a running server (default: start one)")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--books', type=int, default=10_000, help="book ids requested are 1..books")
+    parser.add_argument('--users', type=int, default=1_000, help="user ids used are 1..users")
+    parser.add_argument('--search-ratio', type=float, default=0.6)
+    args = parser.parse_args()
+
+    process = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.port is None:
+            process = start_server(args, workdir)
+        try:
+            asyncio.run(run_load(args))
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
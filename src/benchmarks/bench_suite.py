@@ -0,0 +1,206 @@
+# Repeatable benchmark of the headless Library on a synthetic library: load_data,
+# save_data (full and incremental), the BookBST searches next to the indexed Library
+# searches, borrow/return/reserve and the overdue sweep and report. Each repetition
+# starts from freshly written files in a temporary directory, the clock is pinned to
+# synthetic.AS_OF and every choice comes from the seed, so two runs do the same work.
+# The results go to a JSON file; --compare reads an earlier one and flags operations
+# that got slower, exiting with status 1 if any did.
+#
+# Run from the src directory:
+#     python -m benchmarks.bench_suite --size 100k --out bench-before.json
+#     python -m benchmarks.bench_suite --size 100k --out bench-after.json --compare bench-before.json
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import dates
+import storage
+from library import Library, LibraryError
+from benchmarks import synthetic
+
+
+class Timings:
+    # Seconds per call for every operation, across all repetitions
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+
+    def call(self, op, function, *args):
+        # Library errors (no copy left, already borrowed, ...) are counted, not raised
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        except LibraryError:
+            self.errors[op] += 1
+        finally:
+            self.samples[op].append(time.perf_counter() - start)
+
+    def summary(self):
+        results = {}
+        for op, samples in self.samples.items():
+            ordered = sorted(samples)
+            results[op] = {
+                'calls': len(ordered),
+                'errors': self.errors[op],
+                'total_s': sum(ordered),
+                'mean_s': sum(ordered) / len(ordered),
+                'min_s': ordered[0],
+                'p50_s': statistics.median(ordered),
+                'p95_s': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                'max_s': ordered[-1],
+            }
+        return results
+
+
+def run_once(timings, dataset, args, rnd):
+    synthetic.write_dataset(dataset, args.storage)
+    library = Library(autoload=False, storage_backend=storage.BACKENDS[args.storage]())
+    timings.call('load_data', library.load_data)
+    try:
+        timings.call('save_data_full', library.save_data, True)
+
+        book_ids = list(library.books_by_id)
+        user_ids = list(library.users)
+        bst = library.book_bst
+        for _ in range(args.queries):
+            timings.call('bst.search_by_id', bst.search_by_id, rnd.choice(book_ids))
+            timings.call('bst.search_by_id_miss', bst.search_by_id, -rnd.choice(book_ids))
+            timings.call('library.search_by_title', library.search_by_title, rnd.choice(synthetic.NOUNS))
+            timings.call('library.search_by_author', library.search_by_author, rnd.choice(synthetic.LAST_NAMES))
+        # The tree searches walk the whole catalog, so they get fewer queries
+        for _ in range(args.scan_queries):
+            timings.call('bst.search_by_title', bst.search_by_title, rnd.choice(synthetic.NOUNS))
+            timings.call('bst.search_by_author', bst.search_by_author, rnd.choice(synthetic.LAST_NAMES))
+
+        # The generated overdue loans are all found by the first sweep, the second has nothing new
+        timings.call('sweep_overdue', library.sweep_overdue)
+        timings.call('sweep_overdue_idle', library.sweep_overdue)
+        requests = timings.call('outstanding_overdue', library.outstanding_overdue)
+        timings.call('overdue_amounts', library.overdue_amounts, requests)
+
+        # Borrows pick from books with a copy left, reservations from books with none;
+        # returns take loans out of the generated ones in a seeded order
+        available = [book_id for book_id, book in library.books_by_id.items() if book.copies > 0]
+        unavailable = [book_id for book_id, book in library.books_by_id.items() if book.copies == 0]
+        loans = [(user_id, book_id) for user_id, user in library.users.items() for book_id in user.borrowed_books]
+        returns = rnd.sample(loans, min(args.ops, len(loans)))
+        for i in range(args.ops):
+            timings.call('borrow_book', library.borrow_book, rnd.choice(user_ids), rnd.choice(available))
+            if i < len(returns):
+                timings.call('return_book', library.return_book, *returns[i])
+            if unavailable:
+                timings.call('reserve_book', library.reserve_book, rnd.choice(user_ids), rnd.choice(unavailable))
+        timings.call('save_data', library.save_data)
+    finally:
+        library.storage.close()
+
+
+def git_version():
+    # The commit being measured, with "-dirty" for uncommitted changes; None outside a checkout
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    # Prints each operation against the baseline; returns the operations slower by more than tolerance
+    if results['params'] != baseline['params']:
+        print(f"note: parameters differ from the baseline ({baseline['params']})")
+    regressions = []
+    print(f"{'operation':<26}{'baseline p50':>14}{'p50':>14}{'ratio':>8}")
+    for op, current in results['results'].items():
+        before = baseline['results'].get(op)
+        if not before:
+            print(f"{op:<26}{'-':>14}{current['p50_s'] * 1e3:>11.3f} ms{'new':>8}")
+            continue
+        ratio = current['p50_s'] / before['p50_s'] if before['p50_s'] else 1.0
+        slower = ratio > 1 + tolerance
+        if slower:
+            regressions.append(op)
+        print(f"{op:<26}{before['p50_s'] * 1e3:>11.3f} ms{current['p50_s'] * 1e3:>11.3f} ms{ratio:>7.2f}x"
+              + ("  SLOWER" if slower else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the Library hot paths on a synthetic library")
+    parser.add_argument('--size', default='10k', help="number of books: 10k, 100k, 1m or any number")
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--loans', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', choices=sorted(storage.BACKENDS), default='journal')
+    parser.add_argument('--repeat', type=int, default=3, help="repetitions, each on freshly written files")
+    parser.add_argument('--ops', type=int, default=1000, help="borrows, returns and reservations per repetition")
+    parser.add_argument('--queries', type=int, default=1000, help="id and indexed searches per repetition")
+    parser.add_argument('--scan-queries', type=int, default=20, help="BookBST title and author scans per repetition")
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown of the p50 before it is flagged")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    books = synthetic.parse_size(args.size)
+    start = time.perf_counter()
+    dataset = synthetic.generate(books, args.users, args.loans, seed=args.seed)
+    print(f"generated {books} books, {len(dataset.users)} users in {time.perf_counter() - start:.1f} s")
+
+    timings = Timings()
+    rnd = random.Random(args.seed)
+    previous_clock = dates.set_clock(lambda: synthetic.AS_OF)
+    cwd = os.getcwd()
+    try:
+        for repetition in range(args.repeat):
+            # The backends use their default file names, as the app does, inside a fresh directory
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                try:
+                    run_once(timings, dataset, args, rnd)
+                finally:
+                    os.chdir(cwd)
+            print(f"repetition {repetition + 1}/{args.repeat} done")
+    finally:
+        dates.set_clock(previous_clock)
+
+    params = {'books': books, 'users': len(dataset.users), 'loans': args.loans, 'seed': args.seed,
+              'storage': args.storage, 'repeat': args.repeat, 'ops': args.ops, 'queries': args.queries,
+              'scan_queries': args.scan_queries}
+    results = {
+        'version': git_version(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': timings.summary(),
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'operation':<26}{'calls':>8}{'errors':>8}{'p50':>12}{'p95':>12}{'mean':>12}")
+    for op, result in results['results'].items():
+        print(f"{op:<26}{result['calls']:>8}{result['errors']:>8}{result['p50_s'] * 1e3:>9.3f} ms"
+              f"{result['p95_s'] * 1e3:>9.3f} ms{result['mean_s'] * 1e3:>9.3f} ms")
+    print(f"results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} operations slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+# Stress run for the Library locking: many threads borrow, return (singly and in
+# batches), reserve and settle overdue requests on a small catalog with few copies,
+# while the clock jumps back and forth so some returns come back overdue. Afterwards
+# every book must still account for all of its copies and the loan, due-date and
+# reservation indexes must agree with the loans and queues themselves. Exits with
+# status 1 if any check fails.
+#
+# Run from the src directory:
+#     python -m benchmarks.stress_locks --threads 16 --ops 5000
+#     python -m benchmarks.stress_locks --storage journal   # also exercise the journal
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date
+
+import dates
+import storage
+from library import Library, LibraryError
+from benchmarks.bench_load import make_frames
+
+
+def worker(library, worker_no, ops, errors):
+    rnd = random.Random(worker_no)
+    book_ids = list(library.books_by_id)
+    user_ids = list(library.users)
+    try:
+        for _ in range(ops):
+            roll = rnd.random()
+            user_id, book_id = rnd.choice(user_ids), rnd.choice(book_ids)
+            try:
+                if roll < 0.35:
+                    library.borrow_book(user_id, book_id)
+                elif roll < 0.4:
+                    library.borrow_many([(rnd.choice(user_ids), rnd.choice(book_ids)) for _ in range(5)])
+                elif roll < 0.7:
+                    user = library.users[user_id]
+                    borrowed = list(user.borrowed_books)
+                    if borrowed:
+                        library.return_book(user_id, rnd.choice(borrowed))
+                elif roll < 0.75:
+                    library.return_many([(user_id, borrowed_id) for borrowed_id in list(library.users[user_id].borrowed_books)])
+                elif roll < 0.85:
+                    library.reserve_book(user_id, book_id)
+                elif roll < 0.95:
+                    requests = list(library.overdue_requests)
+                    if requests:
+                        library.settle_overdue(rnd.choice(requests).request_id)
+                elif roll < 0.99:
+                    library.sweep_overdue()
+                else:
+                    library.save_data()
+            except LibraryError:
+                pass  # Losing a race for the last copy or a request is expected
+    except Exception as error:
+        errors.append(error)
+        raise
+
+
+def clock_flipper(stop):
+    # Alternates between today and a month later so loans taken in between come back overdue
+    real_today = date.today()
+    late = date.fromordinal(real_today.toordinal() + 30)
+    while not stop.is_set():
+        for day in (real_today, late):
+            dates.set_clock(lambda day=day: day)
+            time.sleep(0.005)
+    dates.set_clock()
+
+
+def check(library, initial_copies):
+    failures = []
+    loans_per_book = Counter(book_id for user in library.users.values() for book_id in user.borrowed_books)
+    unpaid_per_book = Counter(request.book.book_id for request in library.overdue_requests)
+    for book_id, book in library.books_by_id.items():
+        accounted = book.copies + loans_per_book[book_id] + unpaid_per_book[book_id]
+        if book.copies < 0 or accounted != initial_copies[book_id]:
+            failures.append(f"book {book_id}: {book.copies} on shelf + {loans_per_book[book_id]} on loan + "
+                            f"{unpaid_per_book[book_id]} awaiting payment != {initial_copies[book_id]}")
+        heap = library.loan_index._heaps.get(book_id, [])
+        if len(heap) != loans_per_book[book_id]:
+            failures.append(f"book {book_id}: due-date heap has {len(heap)} entries for {loans_per_book[book_id]} loans")
+
+    library.sweep_overdue()
+    total_loans = sum(loans_per_book.values())
+    if len(library.due_queue) + len(library.overdue_loans) != total_loans:
+        failures.append(f"due queue tracks {len(library.due_queue)} + {len(library.overdue_loans)} overdue loans "
+                        f"for {total_loans} loans")
+
+    queued = Counter((user_id, book.book_id) for book in library.books_by_id.values() for user_id in book.reservations)
+    tracked = Counter({(user_id, book_id): count for user_id, reserved in library.user_reservations.items()
+                       for book_id, count in reserved.items()})
+    if queued != tracked:
+        failures.append("per-user reservation index disagrees with the reservation queues")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer the Library from many threads and check its invariants")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=5000, help="operations per thread")
+    parser.add_argument('--books', type=int, default=50)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--storage', choices=['snapshot', 'journal', 'sqlite'], default='snapshot')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    sys.setswitchinterval(1e-5)  # Switch threads far more often than usual to provoke races
+    books_df, users_df = make_frames(args.books, 0, args.users)
+    books_df['copies'] = books_df['copies'] % 3 + 1  # Few copies per book, so threads contend for the last one
+
+    with tempfile.TemporaryDirectory() as workdir:
+        backend = {
+            'snapshot': lambda: storage.SnapshotBackend(os.path.join(workdir, 'library.snapshot')),
+            'journal': lambda: storage.JournalBackend(os.path.join(workdir, 'library.snapshot'),
+                                                      os.path.join(workdir, 'library.journal')),
+            'sqlite': lambda: storage.SqliteBackend(os.path.join(workdir, 'library.db')),
+        }[args.storage]()
+        library = Library(autoload=False, storage_backend=backend)
+        library.load_books_frame(books_df)
+        library.load_users_frame(users_df)
+        if args.storage == 'journal':
+            backend.journal.open(0)
+        library._rebuild_circulation_indexes()
+        initial_copies = {book_id: book.copies for book_id, book in library.books_by_id.items()}
+
+        stop = threading.Event()
+        flipper = threading.Thread(target=clock_flipper, args=(stop,), daemon=True)
+        flipper.start()
+        errors = []
+        threads = [threading.Thread(target=worker, args=(library, i, args.ops, errors)) for i in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        flipper.join()
+        backend.close()
+
+    failures = [f"worker raised {error!r}" for error in errors] + check(library, initial_copies)
+    print(f"{args.threads} threads x {args.ops} ops in {elapsed:.1f} s "
+          f"({args.threads * args.ops / elapsed:,.0f} ops/s, storage: {args.storage})")
+    for failure in failures[:20]:
+        print("FAIL", failure)
+    print("FAILED" if failures else "all invariants hold")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
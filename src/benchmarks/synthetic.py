@@ -0,0 +1,142 @@
+# Deterministic synthetic libraries for the benchmarks: a catalog with skewed popularity,
+# users, their current loans (some already overdue on AS_OF) and reservation queues on
+# the books that have no copy left. The same size and seed always give the same data,
+# so runs on different versions of the code measure the same library.
+#
+# Run from the src directory to write a dataset in one of the storage formats:
+#     python -m benchmarks.synthetic --size 100k --storage snapshot --out /tmp/library-100k
+import argparse
+import os
+import random
+import time
+from collections import namedtuple
+from datetime import date
+
+import pandas as pd
+
+import snapshot
+import storage
+from library import Library
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+AS_OF = date(2024, 11, 1)  # "Today" for the generated loans; pin dates.set_clock to it when timing
+LOAN_DAYS = 14
+
+ADJECTIVES = ('Silent', 'Crimson', 'Hidden', 'Broken', 'Golden', 'Last', 'Distant', 'Forgotten', 'Burning', 'Quiet',
+              'Endless', 'Hollow', 'Frozen', 'Secret', 'Wild', 'Lost', 'Bright', 'Dark', 'Little', 'Final')
+NOUNS = ('River', 'Garden', 'Empire', 'Winter', 'Harbor', 'Mirror', 'Forest', 'Kingdom', 'Voyage', 'Letter',
+         'Island', 'Tower', 'Shadow', 'Orchard', 'Machine', 'Station', 'Lantern', 'Bridge', 'Desert', 'Archive')
+PLACES = ('the North', 'Avalon', 'the Sea', 'Glass', 'Tomorrow', 'the Valley', 'Stone', 'the City', 'Ash', 'the Moon')
+FIRST_NAMES = ('Ada', 'Ben', 'Clara', 'David', 'Elena', 'Farid', 'Grace', 'Hiro', 'Ines', 'Jonas', 'Kemi', 'Liam',
+               'Maya', 'Nikolai', 'Olga', 'Pedro', 'Quinn', 'Rosa', 'Sami', 'Tara', 'Umar', 'Vera', 'Wei', 'Yara')
+LAST_NAMES = ('Adams', 'Berg', 'Costa', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jensen', 'Kowalski',
+              'Lopez', 'Murphy', 'Nakamura', 'Okafor', 'Petrov', 'Quigley', 'Rossi', 'Silva', 'Tanaka', 'Usman',
+              'Varga', 'Weber', 'Young')
+
+# books and users are DataFrames in the workbook layout; reservations is a list of (book_id, user_id) in queue order
+Dataset = namedtuple('Dataset', ['books', 'users', 'reservations'])
+
+
+def parse_size(text):
+    # "10k", "1m" or a plain number of books
+    return SIZES.get(text.lower()) or int(text)
+
+
+def person(index):
+    # The index-th distinct name; past the plain combinations a number keeps names apart
+    combinations = len(FIRST_NAMES) * len(LAST_NAMES)
+    name = f"{FIRST_NAMES[index % len(FIRST_NAMES)]} {LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)]}"
+    return name if index < combinations else f"{name} {index // combinations + 1}"
+
+
+def generate(books, users=None, loans=None, reservations=None, overdue_share=0.1, seed=0):
+    # Defaults scale with the catalog: a user per five books, a loan per two books and a
+    # reservation per twenty. Popular books (low ids) are borrowed far more than the rest.
+    users = users if users is not None else max(1, books // 5)
+    loans = loans if loans is not None else books // 2
+    reservations = reservations if reservations is not None else books // 20
+    rnd = random.Random(seed)
+    authors = max(1, books // 20)
+
+    books_df = pd.DataFrame({
+        'book_id': range(1, books + 1),
+        'title': [f"{rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)} of {rnd.choice(PLACES)}" for _ in range(books)],
+        'author': [person(int(authors * rnd.random() ** 2)) for _ in range(books)],
+        # About one book in ten has every copy out, so it can only be reserved
+        'copies': [0 if rnd.random() < 0.1 else rnd.randint(1, 5) for _ in range(books)],
+    })
+
+    today = AS_OF.toordinal()
+    borrowed = [{} for _ in range(users)]
+    made = 0
+    while made < min(loans, books * users):
+        user_loans = borrowed[rnd.randrange(users)]
+        book_id = int(books * rnd.random() ** 2) + 1
+        if book_id in user_loans:
+            continue
+        if rnd.random() < overdue_share:
+            borrow_day = today - LOAN_DAYS - rnd.randint(1, 60)
+        else:
+            borrow_day = today - rnd.randint(0, LOAN_DAYS - 1)
+        borrow_date = date.fromordinal(borrow_day).isoformat()
+        due_date = date.fromordinal(borrow_day + LOAN_DAYS).isoformat()
+        user_loans[book_id] = f"{book_id},{borrow_date},{due_date}"
+        made += 1
+    users_df = pd.DataFrame({
+        'user_id': range(1, users + 1),
+        'name': [person(i) for i in range(users)],
+        'borrowed_books': [';'.join(user_loans.values()) for user_loans in borrowed],
+    })
+
+    unavailable = books_df['book_id'][books_df['copies'] == 0].tolist()
+    queue = [(rnd.choice(unavailable), rnd.randint(1, users)) for _ in range(reservations)] if unavailable else []
+    return Dataset(books_df, users_df, queue)
+
+
+def populate(library, dataset):
+    library.load_books_frame(dataset.books)
+    library.load_users_frame(dataset.users)
+    for book_id, user_id in dataset.reservations:
+        library.books_by_id[book_id].add_reservation(user_id)
+    library._rebuild_circulation_indexes()
+    return library
+
+
+def write_dataset(dataset, storage_name, directory='.'):
+    # Writes the dataset where storage.BACKENDS[storage_name]() looks for it when started in directory
+    library = populate(Library(autoload=False), dataset)
+    if storage_name in ('snapshot', 'journal'):
+        snapshot.save_snapshot(library, os.path.join(directory, 'library.snapshot'))
+    elif storage_name == 'sqlite':
+        backend = storage.SqliteBackend(os.path.join(directory, 'library.db'))
+        backend.save_all(library)
+        backend.close()
+    else:
+        # The workbooks have no place for reservations
+        library.export_excel(os.path.join(directory, 'books.xlsx'), os.path.join(directory, 'users.xlsx'))
+    return library
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic library")
+    parser.add_argument('--size', default='10k', help="number of books: 10k, 100k, 1m or any number")
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--loans', type=int, default=None)
+    parser.add_argument('--reservations', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--storage', choices=sorted(storage.BACKENDS), default='journal')
+    parser.add_argument('--out', default='.', help="directory to write the files to")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    start = time.perf_counter()
+    dataset = generate(parse_size(args.size), args.users, args.loans, args.reservations, seed=args.seed)
+    library = write_dataset(dataset, args.storage, args.out)
+    loans = sum(len(user.borrowed_books) for user in library.users.values())
+    print(f"{len(library.books_by_id)} books, {len(library.users)} users, {loans} loans, "
+          f"{len(dataset.reservations)} reservations written for {args.storage} storage to {args.out} "
+          f"in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from itertools import islice
+
+import logging_setup
+import storage
+from library import Book, Library
+
+# Streaming bulk import of books from CSV, JSON-lines or .xlsx files. Rows are read one
+# at a time and merged into the library in chunks, so memory stays bounded by the chunk
+# size rather than the file size. Each row needs book_id, title, author and copies;
+# invalid rows are skipped and counted, and a book_id seen again later in the file
+# updates the earlier row, as a second import of the same book would.
+#
+#     python bulk_import.py books.csv --storage journal --chunk-size 50000
+
+COLUMNS = ('book_id', 'title', 'author', 'copies')
+MAX_ERRORS = 20  # Invalid rows reported in detail; the rest are only counted
+
+
+class ImportStats:
+    # What one import_books call read and merged
+    def __init__(self):
+        self.rows = 0
+        self.added = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []  # (line, message) for the first MAX_ERRORS invalid rows
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return (f"ImportStats(rows={self.rows}, added={self.added}, updated={self.updated}, "
+                f"duplicates={self.duplicates}, invalid={self.invalid}, seconds={self.seconds:.3f}, "
+                f"rows_per_second={self.rows_per_second:,.0f})")
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None  # Counted as an invalid row rather than ending the import
+
+
+def read_xlsx(path):
+    # Read-only mode streams the sheet XML instead of loading the whole workbook
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else '' for name in next(rows, ())]
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+READERS = {'.csv': read_csv, '.jsonl': read_jsonl, '.json': read_jsonl, '.xlsx': read_xlsx}
+
+
+def to_int(value, name):
+    # Accepts ints, integral floats (as spreadsheets hand them back) and numeric strings
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f"{name} must be a whole number, got {value!r}")
+        return int(value)
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number, got {value!r}") from None
+
+
+def parse_book(row):
+    if not isinstance(row, dict):
+        raise ValueError("not a JSON object")
+    missing = [name for name in COLUMNS if row.get(name) in (None, '')]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    title, author = str(row['title']).strip(), str(row['author']).strip()
+    if not title or not author:
+        raise ValueError("title and author must not be blank")
+    copies = to_int(row['copies'], 'copies')
+    if copies < 0:
+        raise ValueError(f"copies must not be negative, got {copies}")
+    return Book(to_int(row['book_id'], 'book_id'), title, author, copies)
+
+
+def import_books(library, path, chunk_size=50_000, progress=None):
+    # Streams path into library in chunks of chunk_size rows; returns an ImportStats.
+    # Only the book_ids seen so far are remembered across chunks (to count duplicates).
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported file type {extension!r}; use {', '.join(sorted(READERS))}")
+    stats = ImportStats()
+    seen = set()
+    start = time.perf_counter()
+    rows = enumerate(READERS[extension](path), start=2 if extension in ('.csv', '.xlsx') else 1)
+    while True:
+        chunk = {}
+        read = 0
+        for line, row in islice(rows, chunk_size):
+            read += 1
+            try:
+                book = parse_book(row)
+            except ValueError as error:
+                stats.invalid += 1
+                if len(stats.errors) < MAX_ERRORS:
+                    stats.errors.append((line, str(error)))
+                continue
+            if book.book_id in seen:
+                stats.duplicates += 1
+            seen.add(book.book_id)
+            chunk[book.book_id] = book  # A later row for the same id wins within the chunk too
+        if not read:
+            break
+        stats.rows += read
+        if chunk:
+            added, updated = library.merge_books(chunk.values())
+            stats.added += added
+            stats.updated += updated
+        stats.seconds = time.perf_counter() - start
+        if progress:
+            progress(stats)
+    stats.seconds = time.perf_counter() - start
+    logging.info(f"Bulk import of {path}: {stats!r}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream books from a CSV, JSON-lines or .xlsx file into the library")
+    parser.add_argument('path')
+    parser.add_argument('--storage', choices=sorted(storage.BACKENDS), default='journal',
+                        help="where library data is kept (default: %(default)s)")
+    parser.add_argument('--chunk-size', type=int, default=50_000, help="rows merged per batch")
+    args = parser.parse_args()
+
+    logging_setup.configure_logging()
+    library = Library(storage_backend=storage.BACKENDS[args.storage]())
+    try:
+        stats = import_books(library, args.path, args.chunk_size,
+                             progress=lambda stats: print(f"{stats.rows:,} rows, {stats.rows_per_second:,.0f} rows/s", flush=True))
+        library.save_data()
+    finally:
+        library.storage.close()
+    print(f"{stats.rows:,} rows in {stats.seconds:.1f} s ({stats.rows_per_second:,.0f} rows/s): "
+          f"{stats.added:,} added, {stats.updated:,} updated, {stats.duplicates:,} duplicate ids, {stats.invalid:,} invalid")
+    for line, message in stats.errors:
+        print(f"  line {line}: {message}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+from datetime import date
+from functools import lru_cache
+
+# Loan dates are kept as day ordinals (date.toordinal()) and only turned into
+# "%Y-%m-%d" strings at the Excel, journal and UI boundaries. Loans cluster on a
+# few hundred distinct days, so both directions are cached.
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()  # Offset between numpy datetime64[D] and day ordinals
+
+_clock = date.today  # The one place "today" comes from; see set_clock
+
+
+@lru_cache(maxsize=4096)
+def to_ordinal(text):
+    return date.fromisoformat(text).toordinal()
+
+
+@lru_cache(maxsize=4096)
+def to_string(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+
+def today():
+    return _clock().toordinal()
+
+
+def set_clock(clock=None):
+    # Replace the clock with any callable returning a date, e.g. lambda: date(2024, 11, 1)
+    # to check overdue handling; set_clock() restores the system clock. Returns the old one.
+    global _clock
+    previous = _clock
+    _clock = clock or date.today
+    return previous
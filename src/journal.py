@@ -0,0 +1,256 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+import dates
+
+# Write-ahead journal of library mutations. Each line is one committed operation:
+#     {"seq": 42, "op": "borrow", "changes": [["book_saved", {...}], ["loan_saved", {...}]]}
+# where every change is one of the StorageBackend row hooks. Lines are written with a
+# single os.write as soon as the operation commits (so a process crash loses nothing)
+# and a flusher thread fsyncs them in groups. The journal is split into numbered
+# segments; a new segment is started on every open and on rotate(), so a torn line
+# left by a crash is always the last line of a sealed segment.
+
+
+class Journal:
+    def __init__(self, base_path='library.journal', commit_interval=0.05):
+        self.base_path = base_path
+        self.commit_interval = commit_interval  # How long the flusher waits to batch fsyncs
+        self.seq = 0
+        self.records_in_segment = 0
+        self._fd = None
+        self._segment = None
+        self._dirty = False
+        self._closed = False
+        self._rotated = 0  # Number of the last segment handed out by rotate()
+        self._cond = threading.Condition()
+        self._flusher = None
+
+    def segments(self):
+        # Existing segment paths, oldest first
+        paths = []
+        for path in glob.glob(glob.escape(self.base_path) + '.*'):
+            suffix = path[len(self.base_path) + 1:]
+            if suffix.isdigit():
+                paths.append((int(suffix), path))
+        return [path for number, path in sorted(paths)]
+
+    def segments_through(self, last):
+        # Existing segments up to and including last, oldest first
+        return [path for path in self.segments() if segment_number(path) <= segment_number(last)]
+
+    def read(self, paths=None, after_seq=0):
+        # Yields committed records with seq > after_seq, skipping a torn trailing line. A
+        # segment is only deleted once a snapshot covering it is written, so one that is
+        # already gone has nothing left to replay.
+        for path in self.segments() if paths is None else paths:
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record['seq'] > after_seq:
+                        yield record
+
+    def open(self, seq):
+        # Start appending after seq, always in a fresh segment
+        with self._cond:
+            self.seq = seq
+            self._start_segment()
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='journal-flusher', daemon=True)
+            self._flusher.start()
+
+    def _start_segment(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+        segments = self.segments()
+        number = segment_number(segments[-1]) + 1 if segments else 1
+        self._segment = f"{self.base_path}.{number:06d}"
+        self._fd = os.open(self._segment, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.records_in_segment = 0
+        self._dirty = False
+
+    def append(self, op, changes):
+        with self._cond:
+            self.seq += 1
+            line = json.dumps({'seq': self.seq, 'op': op, 'changes': changes}, separators=(',', ':')) + '\n'
+            os.write(self._fd, line.encode('utf-8'))
+            self.records_in_segment += 1
+            self._dirty = True
+            self._cond.notify()
+            return self.seq
+
+    def rotate(self):
+        # Seal the current segment and start a new one. Returns the segments sealed since the
+        # last rotate() (after open, also the ones left from earlier runs); the caller owns
+        # them and removes them once a snapshot covering them is written.
+        with self._cond:
+            self._start_segment()
+            sealed = [path for path in self.segments()[:-1] if segment_number(path) > self._rotated]
+            if sealed:
+                self._rotated = segment_number(sealed[-1])
+            return sealed
+
+    def remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            time.sleep(self.commit_interval)  # Let more commits pile up behind this fsync
+            with self._cond:
+                if self._fd is None or not self._dirty:
+                    continue
+                self._dirty = False
+                fd = os.dup(self._fd)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+        if self._flusher is not None:
+            self._flusher.join()
+
+
+def segment_number(path):
+    return int(path.rsplit('.', 1)[1])
+
+
+def apply_record(library, record):
+    # Replays one journal record against an in-memory Library without side effects
+    for kind, data in record['changes']:
+        APPLY[kind](library, data)
+
+
+def _book_saved(library, data):
+    from library import Book
+
+    book = library.books_by_id.get(data['book_id'])
+    if book:
+        book.title, book.author, book.copies = data['title'], data['author'], data['copies']
+    else:
+        book = library.books_by_id[data['book_id']] = Book(data['book_id'], data['title'], data['author'], data['copies'])
+        library.book_bst.insert(book)
+    library.catalog_index.add(book)
+    library.prefix_index.add(book)
+
+
+def _book_deleted(library, data):
+    if library.books_by_id.pop(data['book_id'], None):
+        library.book_bst.delete(data['book_id'])
+        library.catalog_index.remove(data['book_id'])
+        library.prefix_index.remove(data['book_id'])
+
+
+def _user_saved(library, data):
+    from library import User
+
+    user = library.users.get(data['user_id'])
+    if user:
+        user.name = data['name']
+    else:
+        library.users[data['user_id']] = User(data['user_id'], data['name'])
+
+
+def _user_deleted(library, data):
+    library.users.pop(data['user_id'], None)
+
+
+def _loan_saved(library, data):
+    from library import Loan
+
+    user = library.users.get(data['user_id'])
+    book = library.books_by_id.get(data['book_id'])
+    if user and book:
+        user.borrowed_books.pop(book.book_id, None)  # A re-saved loan moves to the end, as a fresh borrow would
+        user.borrowed_books[book.book_id] = Loan(book, dates.to_ordinal(data['borrow_date']), dates.to_ordinal(data['due_date']))
+
+
+def _loan_deleted(library, data):
+    user = library.users.get(data['user_id'])
+    if user:
+        user.borrowed_books.pop(data['book_id'], None)
+
+
+def _reservation_added(library, data):
+    book = library.books_by_id.get(data['book_id'])
+    if book:
+        book.add_reservation(data['user_id'])
+
+
+def _reservation_removed(library, data):
+    book = library.books_by_id.get(data['book_id'])
+    if book:
+        book.remove_reservation(data['user_id'])
+
+
+def _overdue_saved(library, data):
+    from library import OverdueRequest
+
+    user = library.users.get(data['user_id'])
+    book = library.books_by_id.get(data['book_id'])
+    if user and book:
+        request = OverdueRequest(user, book, data['days_overdue'])
+        request.paid = data['paid']
+        library.overdue_requests.add(request)
+
+
+def _overdue_deleted(library, data):
+    request = library.overdue_requests.find(data['user_id'], data['book_id'], data['days_overdue'])
+    if request:
+        library.overdue_requests.remove(request.request_id)
+
+
+APPLY = {
+    'book_saved': _book_saved,
+    'book_deleted': _book_deleted,
+    'user_saved': _user_saved,
+    'user_deleted': _user_deleted,
+    'loan_saved': _loan_saved,
+    'loan_deleted': _loan_deleted,
+    'reservation_added': _reservation_added,
+    'reservation_removed': _reservation_removed,
+    'overdue_saved': _overdue_saved,
+    'overdue_deleted': _overdue_deleted,
+}
+
+
+def replay(library, records):
+    count = 0
+    last_seq = None
+    for record in records:
+        apply_record(library, record)
+        last_seq = record['seq']
+        count += 1
+    if count:
+        logging.debug(f"Replayed {count} journal records")
+    return last_seq
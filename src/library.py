@@ -0,0 +1,969 @@
+from collections import Counter, deque, namedtuple
+import numpy as np
+import pandas as pd
+import logging
+import threading
+import time
+import dates
+import storage
+from loan_index import ActiveLoanIndex, DueQueue
+from locking import LockStripes
+from overdue import FeeSchedule, OverdueStore
+from search_index import CatalogIndex, PrefixIndex
+
+class TreeNode:
+    __slots__ = ('book', 'left', 'right', 'height')
+
+    def __init__(self, book):
+        self.book = book
+        self.left = None
+        self.right = None
+        self.height = 1
+
+def _height(node):
+    return node.height if node else 0
+
+def _update(node):
+    node.height = 1 + max(_height(node.left), _height(node.right))
+
+def _rotate_right(node):
+    pivot = node.left
+    node.left = pivot.right
+    pivot.right = node
+    _update(node)
+    _update(pivot)
+    return pivot
+
+def _rotate_left(node):
+    pivot = node.right
+    node.right = pivot.left
+    pivot.left = node
+    _update(node)
+    _update(pivot)
+    return pivot
+
+def _rebalance(node):
+    _update(node)
+    balance = _height(node.left) - _height(node.right)
+    if balance > 1:
+        if _height(node.left.left) < _height(node.left.right):
+            node.left = _rotate_left(node.left)
+        return _rotate_right(node)
+    if balance < -1:
+        if _height(node.right.right) < _height(node.right.left):
+            node.right = _rotate_right(node.right)
+        return _rotate_left(node)
+    return node
+
+class BookBST:
+    # AVL tree keyed by book_id. Insert, search and delete walk the tree iteratively
+    # and keep the path on an explicit stack for rebalancing, so a catalog loaded in
+    # book_id order stays O(log n) deep and never hits the recursion limit.
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def build_from_sorted(cls, books):
+        # Build a perfectly balanced tree in O(n) from books sorted by book_id
+        tree = cls()
+        books = list(books)
+        if not books:
+            return tree
+        nodes = [None] * len(books)
+        # Each entry is (lo, hi, parent_index, is_left); nodes are created top-down
+        stack = [(0, len(books) - 1, None, False)]
+        order = []
+        while stack:
+            lo, hi, parent, is_left = stack.pop()
+            mid = (lo + hi) // 2
+            node = TreeNode(books[mid])
+            nodes[mid] = node
+            if parent is None:
+                tree.root = node
+            elif is_left:
+                nodes[parent].left = node
+            else:
+                nodes[parent].right = node
+            order.append(node)
+            if lo <= mid - 1:
+                stack.append((lo, mid - 1, mid, True))
+            if mid + 1 <= hi:
+                stack.append((mid + 1, hi, mid, False))
+        # Parents were visited before their children, so fix heights bottom-up
+        for node in reversed(order):
+            _update(node)
+        tree.size = len(books)
+        return tree
+
+    def _relink(self, path, index, node):
+        # Point the parent at path[index - 1] (or the root) to the rebalanced subtree
+        if index == 0:
+            self.root = node
+        else:
+            parent = path[index - 1]
+            if parent.left is path[index]:
+                parent.left = node
+            else:
+                parent.right = node
+
+    def _rebalance_path(self, path):
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            balanced = _rebalance(node)
+            if balanced is not node:
+                self._relink(path, i, balanced)
+                path[i] = balanced
+
+    def insert(self, book):
+        if self.root is None:
+            self.root = TreeNode(book)
+            self.size = 1
+            return
+        path = []
+        node = self.root
+        while node is not None:
+            path.append(node)
+            if book.book_id < node.book.book_id:
+                node = node.left
+            elif book.book_id > node.book.book_id:
+                node = node.right
+            else:
+                node.book = book  # Same ID: replace the stored book
+                return
+        parent = path[-1]
+        if book.book_id < parent.book.book_id:
+            parent.left = TreeNode(book)
+        else:
+            parent.right = TreeNode(book)
+        self.size += 1
+        self._rebalance_path(path)
+
+    def delete(self, book_id):
+        path = []
+        node = self.root
+        while node is not None and node.book.book_id != book_id:
+            path.append(node)
+            node = node.left if book_id < node.book.book_id else node.right
+        if node is None:
+            return False
+
+        if node.left is not None and node.right is not None:
+            # Replace with the in-order successor, then unlink the successor instead
+            path.append(node)
+            successor = node.right
+            while successor.left is not None:
+                path.append(successor)
+                successor = successor.left
+            node.book = successor.book
+            node = successor
+
+        child = node.left if node.left is not None else node.right
+        if not path:
+            self.root = child
+        elif path[-1].left is node:
+            path[-1].left = child
+        else:
+            path[-1].right = child
+        self.size -= 1
+        self._rebalance_path(path)
+        return True
+
+    def search_by_id(self, book_id):
+        node = self.root
+        while node is not None:
+            if book_id == node.book.book_id:
+                return node.book
+            node = node.left if book_id < node.book.book_id else node.right
+        return None
+
+    def __iter__(self):
+        # In-order traversal, yields books sorted by book_id
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.book
+            node = node.right
+
+    def search_by_title(self, title):
+        title = title.lower()
+        return [book for book in self if title in book.title.lower()]
+
+    def search_by_author(self, author):
+        author = author.lower()
+        return [book for book in self if author in book.author.lower()]
+
+class Book:
+    # __slots__ instead of a per-instance __dict__; catalogs hold millions of these
+    __slots__ = ('book_id', 'title', 'author', 'copies', '_reservations')
+
+    def __init__(self, book_id, title, author, copies):
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.copies = copies
+        self._reservations = None  # Queue for reservations, created on the first reservation
+
+    @property
+    def reservations(self):
+        # Read-only view of the queue; use add_reservation/pop_reservation/remove_reservation to change it
+        return self._reservations if self._reservations is not None else ()
+
+    def add_reservation(self, user_id):
+        if self._reservations is None:
+            self._reservations = deque()
+        self._reservations.append(user_id)
+
+    def pop_reservation(self):
+        user_id = self._reservations.popleft()
+        if not self._reservations:
+            self._reservations = None
+        return user_id
+
+    def remove_reservation(self, user_id):
+        if self._reservations is not None and user_id in self._reservations:
+            self._reservations.remove(user_id)
+            if not self._reservations:
+                self._reservations = None
+
+    def to_dict(self):
+        return {
+            'book_id': self.book_id,
+            'title': self.title,
+            'author': self.author,
+            'copies': self.copies
+        }
+    
+    @staticmethod
+    def from_dict(data):
+        return Book(
+            book_id=data['book_id'],
+            title=data['title'],
+            author=data['author'],
+            copies=data['copies']
+        )
+
+class Loan:
+    # One borrowed book. Dates are day ordinals; borrow_date/due_date give the
+    # "%Y-%m-%d" strings, and a Loan still unpacks like the old
+    # (book, borrow_date, due_date) tuple.
+    __slots__ = ('book', 'borrow_day', 'due_day')
+
+    def __init__(self, book, borrow_day, due_day):
+        self.book = book
+        self.borrow_day = borrow_day
+        self.due_day = due_day
+
+    @property
+    def borrow_date(self):
+        return dates.to_string(self.borrow_day)
+
+    @property
+    def due_date(self):
+        return dates.to_string(self.due_day)
+
+    def __iter__(self):
+        return iter((self.book, self.borrow_date, self.due_date))
+
+class User:
+    __slots__ = ('user_id', 'name', 'borrowed_books')
+
+    def __init__(self, user_id, name):
+        self.user_id = user_id
+        self.name = name
+        self.borrowed_books = {}  # book_id -> Loan, in the order the books were borrowed
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'name': self.name,
+            'borrowed_books': [(book.to_dict(), date, due_date) for book, date, due_date in self.borrowed_books.values()]
+        }
+
+    @staticmethod
+    def from_dict(data):
+        user = User(
+            user_id=data['user_id'],
+            name=data['name']
+        )
+        for book_data, date, due_date in data['borrowed_books']:
+            book = Book.from_dict(book_data)
+            user.borrowed_books[book.book_id] = Loan(book, dates.to_ordinal(date), dates.to_ordinal(due_date))
+        return user
+
+class OverdueRequest:
+    __slots__ = ('request_id', 'user', 'book', 'days_overdue', 'paid')
+
+    def __init__(self, user, book, days_overdue):
+        self.request_id = None  # Assigned by OverdueStore.add
+        self.user = user
+        self.book = book
+        self.days_overdue = days_overdue
+        self.paid = False  # Track if the overdue fee has been paid
+
+    def to_dict(self):
+        return {
+            'user_id': self.user.user_id,
+            'book_id': self.book.book_id,
+            'days_overdue': self.days_overdue,
+            'paid': self.paid
+        }
+    
+    def calculate_overdue_amount(self, fee_per_day=1):
+        return self.days_overdue * fee_per_day
+    
+class LibraryError(Exception):
+    pass
+
+class NotFoundError(LibraryError):
+    pass
+
+class AlreadyBorrowedError(LibraryError):
+    pass
+
+class NotBorrowedError(LibraryError):
+    pass
+
+class BookUnavailableError(LibraryError):
+    pass
+
+class BookAvailableError(LibraryError):
+    pass
+
+# What the circulation operations hand back to the caller (GUI, server or batch job)
+BorrowResult = namedtuple('BorrowResult', ['book', 'borrow_date', 'due_date'])
+ReturnResult = namedtuple('ReturnResult', ['book', 'days_overdue', 'overdue_request', 'overdue_amount'])
+ReserveResult = namedtuple('ReserveResult', ['book', 'tentative_date'])
+# One entry of a borrow_many/return_many call: result is set on success, error otherwise
+BatchItem = namedtuple('BatchItem', ['user_id', 'book_id', 'result', 'error'])
+
+def _parse_loan_fields(fields):
+    # (n, 3) strings of book_id, borrow_date, due_date -> book ids, (n, 2) day ordinals and a
+    # mask of the rows that parsed. Dates become day ordinals in one numpy pass; only if that
+    # fails is the slower lenient parse run, where a malformed id or date drops just its loan.
+    try:
+        book_ids = fields[:, 0].astype('int64')
+        days = fields[:, 1:].astype('datetime64[D]').astype('int64') + dates.EPOCH_ORDINAL
+        return book_ids, days, np.ones(len(fields), dtype=bool)
+    except ValueError:
+        pass
+    numbers = pd.to_numeric(pd.Series(fields[:, 0]), errors='coerce').to_numpy(dtype='float64')
+    stamps = pd.to_datetime(pd.Series(fields[:, 1:].ravel()), format='ISO8601', errors='coerce')
+    parsed = (numbers == np.floor(numbers)) & stamps.notna().to_numpy().reshape(-1, 2).all(axis=1)
+    logging.warning(f"Skipped {int((~parsed).sum())} loans with a malformed book id or date")
+    book_ids = np.where(parsed, numbers, 0).astype('int64')
+    days = stamps.to_numpy().astype('datetime64[D]').astype('int64').reshape(-1, 2) + dates.EPOCH_ORDINAL
+    return book_ids, days, parsed
+
+class Library:
+    BOOKS_FILE = 'books.xlsx'
+    USERS_FILE = 'users.xlsx'
+    FIRST_SHEET = 'Sheet1'  # pandas' default, the name the first sheet of both workbooks always had
+    OVERDUE_SHEET = 'overdue_requests'  # Second sheet of the users workbook
+
+    def __init__(self, autoload=True, storage_backend=None):
+        if storage_backend is None:
+            # A library that is not loaded from disk is not written back to it either
+            storage_backend = storage.JournalBackend() if autoload else storage.StorageBackend()
+        self.storage = storage_backend
+        self.books_by_id = {}
+        self.users = {}
+        self.book_bst = BookBST()
+        self.catalog_index = CatalogIndex()
+        self.prefix_index = PrefixIndex()
+        self.overdue_requests = OverdueStore()
+        self.fee_schedule = FeeSchedule()
+        self.loan_index = ActiveLoanIndex()
+        self.user_reservations = {}  # user_id -> {book_id: number of places in that book's queue}
+        self.due_queue = DueQueue()
+        self.overdue_loans = {}  # (user_id, book_id) -> (due_day, OverdueRequest) for overdue loans still out
+        # Concurrency: an operation holds the stripes of the users and books it touches
+        # (LockStripes orders them), then the short leaf locks below for shared indexes.
+        # Leaf locks are never held while taking a stripe.
+        self.locks = LockStripes()
+        self.overdue_lock = threading.Lock()  # due_queue, overdue_loans and overdue_requests; shared with the sweeper
+        self._index_lock = threading.RLock()  # Catalog structures (dict, tree, search indexes) and user_reservations
+        self.dirty_books = set()  # IDs of books and users changed since the last save
+        self.dirty_users = set()
+        self.last_save_stats = None
+        if autoload:
+            self.load_data()
+
+    def add_book(self, book):
+        with self.locks.hold(books=[book.book_id]):
+            with self._index_lock:
+                self.books_by_id[book.book_id] = book
+                self.book_bst.insert(book)  # Insert into the BST
+                self._index_book(book)
+            self.dirty_books.add(book.book_id)
+            with self.storage.transaction('add_book'):
+                self.storage.book_saved(book)
+            logging.info(f"Added book: {book.title} (ID: {book.book_id})",
+                         extra={'event': 'add_book', 'book_id': book.book_id, 'title': book.title})
+
+    def merge_books(self, books):
+        # Bulk upsert used by imports: new books are added and existing ones are updated in
+        # place, so loans and reservations keep pointing at the same objects. The indexes
+        # and storage are updated once for the whole batch. Returns (added, updated).
+        books = list({book.book_id: book for book in books}.values())
+        added, updated = [], []
+        with self.locks.hold(books=[book.book_id for book in books]):
+            with self._index_lock:
+                for book in books:
+                    existing = self.books_by_id.get(book.book_id)
+                    if existing:
+                        existing.title, existing.author, existing.copies = book.title, book.author, book.copies
+                        updated.append(existing)
+                    else:
+                        self.books_by_id[book.book_id] = book
+                        added.append(book)
+                if len(added) * 8 >= len(self.book_bst):
+                    # A large batch is cheaper to absorb by rebuilding the tree in one O(n) pass
+                    all_books = sorted(self.books_by_id.values(), key=lambda book: book.book_id)
+                    self.book_bst = BookBST.build_from_sorted(all_books)
+                else:
+                    for book in added:
+                        self.book_bst.insert(book)
+                self.catalog_index.build(added + updated)
+                self.prefix_index.add_many(added + updated)
+            self.dirty_books.update(book.book_id for book in books)
+            with self.storage.transaction('import_books'):
+                for book in added + updated:
+                    self.storage.book_saved(book)
+        logging.info(f"Imported {len(added)} new and {len(updated)} updated books",
+                     extra={'event': 'import_books', 'added': len(added), 'updated': len(updated)})
+        return len(added), len(updated)
+
+    def _index_book(self, book):
+        self.catalog_index.add(book)
+        self.prefix_index.add(book)
+
+    def _unindex_book(self, book_id):
+        self.catalog_index.remove(book_id)
+        self.prefix_index.remove(book_id)
+
+    def add_user(self, user):
+        with self.locks.hold(users=[user.user_id]):
+            self.users[user.user_id] = user
+            self.dirty_users.add(user.user_id)
+            with self.storage.transaction('add_user'):
+                self.storage.user_saved(user)
+            logging.info(f"Added user: {user.name} (ID: {user.user_id})", extra={'event': 'add_user', 'user_id': user.user_id})
+
+    def search_by_id(self, book_id):
+        return self.books_by_id.get(book_id)
+
+    def search_by_title(self, title):
+        with self._index_lock:
+            return [self.books_by_id[book_id] for book_id in self.catalog_index.search('title', title)]
+
+    def search_by_author(self, author):
+        with self._index_lock:
+            return [self.books_by_id[book_id] for book_id in self.catalog_index.search('author', author)]
+
+    def suggest(self, field, prefix, k=10):
+        with self._index_lock:
+            return [self.books_by_id[book_id] for book_id in self.prefix_index.suggest(field, prefix, k)]
+
+    def borrow_book(self, user_id, book_id):
+        with self.locks.hold(users=[user_id], books=[book_id]):
+            user, book = self._check_borrow(user_id, book_id)
+            with self.storage.transaction('borrow'):
+                result = self._borrow(user, book)
+            logging.info(f"Borrowed book: {book.title} (ID: {book.book_id}) by user {user.name} (ID: {user.user_id})",
+                         extra={'event': 'borrow', 'user_id': user.user_id, 'user_name': str(user.name),
+                                'book_id': book.book_id, 'title': book.title})
+            return result
+
+    def return_book(self, user_id, book_id):
+        with self.locks.hold(users=[user_id], books=[book_id]):
+            user, book, loan = self._check_return(user_id, book_id)
+            with self.storage.transaction('return'):
+                result = self._return(user, book, loan)
+            logging.info(f"Requested return of overdue book: {book.title} (ID: {book.book_id}) by user {user.name} (ID: {user.user_id})",
+                         extra={'event': 'return', 'user_id': user.user_id, 'book_id': book.book_id, 'title': book.title,
+                                'days_overdue': result.days_overdue})
+            return result
+
+    def borrow_many(self, pairs):
+        # Borrows for a list of (user_id, book_id) pairs, e.g. a whole checkout desk queue.
+        # Every pair is checked before anything changes, counting copies claimed earlier in
+        # the same batch; the valid ones are then applied in one storage transaction with
+        # one log line. Returns a BatchItem per pair, in order.
+        pairs = list(pairs)
+        with self.locks.hold(users=[user_id for user_id, _ in pairs], books=[book_id for _, book_id in pairs]):
+            checked = []
+            seen = set()
+            claimed = Counter()  # Copies of each book taken by earlier pairs in the batch
+            for user_id, book_id in pairs:
+                try:
+                    user, book = self._check_borrow(user_id, book_id)
+                    if (user_id, book_id) in seen:
+                        raise AlreadyBorrowedError(f"Book '{book.title}' is already borrowed.")
+                    if book.copies - claimed[book_id] <= 0:
+                        raise BookUnavailableError("Book not available.")
+                    claimed[book_id] += 1
+                    seen.add((user_id, book_id))
+                    checked.append((user_id, book_id, (user, book), None))
+                except LibraryError as error:
+                    checked.append((user_id, book_id, None, error))
+            items = self._apply_batch('borrow_many', checked, self._borrow)
+            borrowed = [[item.user_id, item.book_id] for item in items if item.result]
+            failed = len(items) - len(borrowed)
+            logging.info(f"Batch borrow: {len(borrowed)} of {len(items)} books borrowed, {failed} rejected",
+                         extra={'event': 'borrow_many', 'borrowed': borrowed, 'rejected': failed})
+            return items
+
+    def return_many(self, pairs):
+        # Returns for a list of (user_id, book_id) pairs, e.g. a check-in cart; checked up
+        # front and applied together like borrow_many. Overdue books become overdue requests
+        # exactly as return_book makes them.
+        pairs = list(pairs)
+        with self.locks.hold(users=[user_id for user_id, _ in pairs], books=[book_id for _, book_id in pairs]):
+            checked = []
+            seen = set()
+            for user_id, book_id in pairs:
+                try:
+                    if (user_id, book_id) in seen:
+                        raise NotBorrowedError("Book not borrowed or user not found.")  # Scanned twice
+                    checked.append((user_id, book_id, self._check_return(user_id, book_id), None))
+                    seen.add((user_id, book_id))
+                except LibraryError as error:
+                    checked.append((user_id, book_id, None, error))
+            items = self._apply_batch('return_many', checked, self._return)
+            returned = [[item.user_id, item.book_id, item.result.days_overdue] for item in items if item.result]
+            overdue = sum(days_overdue > 0 for _, _, days_overdue in returned)
+            logging.info(f"Batch return: {len(returned) - overdue} books returned, {overdue} overdue requests, "
+                         f"{len(items) - len(returned)} rejected",
+                         extra={'event': 'return_many', 'returned': returned, 'rejected': len(items) - len(returned)})
+            return items
+
+    def _apply_batch(self, op, checked, apply):
+        # An unexpected error fails only its own item: rolling the whole transaction back
+        # would drop the items already applied in memory from storage, so they are committed
+        items = []
+        with self.storage.transaction(op):
+            for user_id, book_id, args, error in checked:
+                result = None
+                if args:
+                    try:
+                        result = apply(*args)
+                    except Exception as unexpected:
+                        logging.exception(f"{op} failed for user {user_id}, book {book_id}")
+                        error = unexpected
+                items.append(BatchItem(user_id, book_id, result, error))
+        return items
+
+    def _check_borrow(self, user_id, book_id):
+        user = self.users.get(user_id)
+        book = self.books_by_id.get(book_id)
+        if not (user and book):
+            raise NotFoundError("User or book not found.")
+        if book.book_id in user.borrowed_books:  # Check if book is already borrowed
+            raise AlreadyBorrowedError(f"Book '{book.title}' is already borrowed.")
+        if book.copies <= 0:
+            raise BookUnavailableError("Book not available.")
+        return user, book
+
+    def _borrow(self, user, book):
+        # Applies a checked borrow; the caller holds the locks and the storage transaction
+        book.copies -= 1
+        today = dates.today()
+        loan = Loan(book, today, today + 14)  # Borrowed today, due in 14 days
+        borrow_date, due_date = loan.borrow_date, loan.due_date
+        user.borrowed_books[book.book_id] = loan
+        self.loan_index.add(book.book_id, loan.due_day, user.user_id)
+        with self.overdue_lock:
+            self.due_queue.push(user.user_id, book.book_id, loan.due_day)
+        self.dirty_books.add(book.book_id)
+        self.dirty_users.add(user.user_id)
+        self.storage.book_saved(book)
+        self.storage.loan_saved(user.user_id, book.book_id, borrow_date, due_date)
+        return BorrowResult(book, borrow_date, due_date)
+
+    def _check_return(self, user_id, book_id):
+        user = self.users.get(user_id)
+        book = self.books_by_id.get(book_id)
+        borrowed_book = user.borrowed_books.get(book_id) if user and book else None
+        if not borrowed_book:
+            raise NotBorrowedError("Book not borrowed or user not found.")
+        return user, book, borrowed_book
+
+    def _return(self, user, book, borrowed_book):
+        # Applies a checked return; the caller holds the locks and the storage transaction
+        days_overdue = dates.today() - borrowed_book.due_day
+
+        overdue_request = overdue_amount = None
+        if days_overdue > 0:
+            # Create an overdue request instead of returning the book; the copy
+            # goes back on the shelf when the request is marked as paid
+            overdue_request = OverdueRequest(user, book, days_overdue)
+            with self.overdue_lock:
+                self.overdue_requests.add(overdue_request)
+            overdue_amount = self.fee_schedule.amount(days_overdue)
+        else:
+            book.copies += 1
+
+        del user.borrowed_books[book.book_id]
+        self.loan_index.remove(book.book_id, borrowed_book.due_day, user.user_id)
+        with self.overdue_lock:
+            self.due_queue.discard(user.user_id, book.book_id)
+            self.overdue_loans.pop((user.user_id, book.book_id), None)
+
+        next_user_id = None
+        if book.reservations:
+            next_user_id = book.pop_reservation()  # Get the next user in the queue
+            with self._index_lock:
+                self._untrack_reservation(book.book_id, next_user_id)
+
+        self.dirty_books.add(book.book_id)
+        self.dirty_users.add(user.user_id)
+        self.storage.book_saved(book)
+        self.storage.loan_deleted(user.user_id, book.book_id)
+        if overdue_request:
+            self.storage.overdue_saved(overdue_request)
+        if next_user_id is not None:
+            self.storage.reservation_removed(book.book_id, next_user_id)
+        return ReturnResult(book, max(days_overdue, 0), overdue_request, overdue_amount)
+
+    def reserve_book(self, user_id, book_id):
+        with self.locks.hold(users=[user_id], books=[book_id]):
+            user = self.users.get(user_id)
+            book = self.books_by_id.get(book_id)
+            if not (user and book):
+                raise NotFoundError("User or book not found.")
+            if book.copies != 0:
+                raise BookAvailableError("Book is currently available. You can borrow it now.")
+            # Add user to the reservations queue
+            book.add_reservation(user_id)
+            with self._index_lock:
+                self._track_reservation(book.book_id, user_id)
+            self.dirty_books.add(book.book_id)
+            with self.storage.transaction('reserve'):
+                self.storage.reservation_added(book.book_id, user_id)
+            logging.info(f"User     {user.name} (ID: {user.user_id}) reserved book: {book.title} (ID: {book.book_id})",
+                         extra={'event': 'reserve', 'user_id': user.user_id, 'book_id': book.book_id, 'title': book.title})
+
+            # The tentative available date is the earliest due date among the copies on loan
+            return ReserveResult(book, self.tentative_available_date(book.book_id))
+
+    def tentative_available_date(self, book_id):
+        due_day = self.loan_index.earliest_due(book_id)
+        return dates.to_string(due_day) if due_day is not None else None
+
+    def reserved_books(self, user_id):
+        with self._index_lock:
+            book_ids = list(self.user_reservations.get(user_id, ()))
+        return [self.books_by_id[book_id] for book_id in book_ids if book_id in self.books_by_id]
+
+    def _track_reservation(self, book_id, user_id):
+        reserved = self.user_reservations.setdefault(user_id, {})
+        reserved[book_id] = reserved.get(book_id, 0) + 1
+
+    def _untrack_reservation(self, book_id, user_id):
+        reserved = self.user_reservations.get(user_id, {})
+        if book_id in reserved:
+            reserved[book_id] -= 1
+            if not reserved[book_id]:
+                del reserved[book_id]
+
+    def _rebuild_circulation_indexes(self):
+        self.loan_index.build(self.users.values())
+        with self.overdue_lock:
+            self.due_queue.build(self.users.values())
+            self.overdue_loans = {}
+        self.user_reservations = {}
+        for book in self.books_by_id.values():
+            for user_id in book.reservations:
+                self._track_reservation(book.book_id, user_id)
+
+    def sweep_overdue(self):
+        # Moves loans that fell due since the last sweep into overdue_loans (O(k log n) for
+        # k newly overdue loans) and refreshes the day count of the ones already there
+        today = dates.today()
+        with self.overdue_lock:
+            newly_overdue = 0
+            for user_id, book_id, due_day in self.due_queue.pop_due(today):
+                user = self.users.get(user_id)
+                book = self.books_by_id.get(book_id)
+                if user and book:
+                    self.overdue_loans[(user_id, book_id)] = (due_day, OverdueRequest(user, book, today - due_day))
+                    newly_overdue += 1
+            for due_day, request in self.overdue_loans.values():
+                request.days_overdue = today - due_day
+        if newly_overdue:
+            logging.info(f"Overdue sweep found {newly_overdue} newly overdue loans")
+        return newly_overdue
+
+    def outstanding_overdue(self):
+        # Overdue loans that have not been returned yet, most overdue first
+        with self.overdue_lock:
+            requests = [request for due_day, request in self.overdue_loans.values()]
+        return sorted(requests, key=lambda request: -request.days_overdue)
+
+    def overdue_amounts(self, requests):
+        # Fees for many requests at once under the current fee schedule
+        return self.fee_schedule.amounts([request.days_overdue for request in requests])
+
+    def mark_request_as_paid(self, request):
+        with self.locks.hold(users=[request.user.user_id], books=[request.book.book_id]):
+            with self.overdue_lock:
+                if request.paid or self.overdue_requests.remove(request.request_id) is None:
+                    return  # Already settled, e.g. by another desk
+            request.paid = True
+            # Return the book back to the library
+            request.book.copies += 1
+            self.dirty_books.add(request.book.book_id)
+            self.dirty_users.add(request.user.user_id)
+            with self.storage.transaction('mark_paid'):
+                self.storage.book_saved(request.book)
+                self.storage.overdue_deleted(request)
+            logging.info(f"Overdue request for book '{request.book.title}' marked as paid by user {request.user.name}.",
+                         extra={'event': 'mark_paid', 'user_id': request.user.user_id, 'book_id': request.book.book_id,
+                                'days_overdue': request.days_overdue})
+
+    def settle_overdue(self, request_id):
+        with self.overdue_lock:
+            request = self.overdue_requests.get(request_id)
+        if not request:
+            raise NotFoundError("Overdue request not found.")
+        self.mark_request_as_paid(request)
+        return request
+
+    def modify_book(self, book_id, new_title, new_author, new_copies):
+        with self.locks.hold(books=[book_id]):
+            book = self.books_by_id.get(book_id)
+            if not book:
+                raise NotFoundError("Book not found.")
+            book.title = new_title
+            book.author = new_author
+            book.copies = new_copies
+            with self._index_lock:
+                self._index_book(book)  # Re-index the new title and author
+            self.dirty_books.add(book_id)
+            with self.storage.transaction('modify_book'):
+                self.storage.book_saved(book)
+            logging.info(f"Modified book: {book.title} (ID: {book.book_id})", extra={'event': 'modify_book', 'book_id': book.book_id})
+            return book
+
+    def delete_book(self, book_id):
+        with self.locks.hold(books=[book_id]):
+            with self._index_lock:
+                book = self.books_by_id.pop(book_id, None)
+                if book is None:
+                    raise NotFoundError("Book not found.")
+                self.book_bst.delete(book_id)
+                self._unindex_book(book_id)
+            self.dirty_books.add(book_id)
+            with self.storage.transaction('delete_book'):
+                self.storage.book_deleted(book_id)
+            logging.info(f"Deleted book: {book_id}", extra={'event': 'delete_book', 'book_id': book_id})
+            return book
+
+    def delete_user(self, user_id):
+        with self.locks.hold(users=[user_id]):
+            if user_id not in self.users:
+                raise NotFoundError("User not found.")
+            user = self.users[user_id]
+            with self._index_lock:
+                reserved_ids = list(self.user_reservations.get(user_id, {}))
+            # Book stripes come after user stripes
+            with self.locks.hold(books=list(user.borrowed_books) + reserved_ids):
+                del self.users[user_id]
+                for loan in user.borrowed_books.values():
+                    self.loan_index.remove(loan.book.book_id, loan.due_day, user_id)
+                    with self.overdue_lock:
+                        self.due_queue.discard(user_id, loan.book.book_id)
+                        self.overdue_loans.pop((user_id, loan.book.book_id), None)
+                # Leave the reservation queues too, so a return never hands a book to a deleted
+                # user. Read again now that the book stripes are held and no return can pop one.
+                with self._index_lock:
+                    reserved = self.user_reservations.pop(user_id, {})
+                for book_id, places in reserved.items():
+                    book = self.books_by_id.get(book_id)
+                    if book:
+                        for _ in range(places):
+                            book.remove_reservation(user_id)
+                        self.dirty_books.add(book_id)
+                self.dirty_users.add(user_id)
+                with self.storage.transaction('delete_user'):
+                    self.storage.user_deleted(user_id)
+                    for book_id, places in reserved.items():
+                        for _ in range(places):
+                            self.storage.reservation_removed(book_id, user_id)
+            logging.info(f"Deleted user: {user_id}", extra={'event': 'delete_user', 'user_id': user_id})
+            return user
+
+    def get_all_users(self):
+        return self.users.values()
+
+    def save_data(self, full=False):
+        # Incremental by default: nothing is written when no book or user changed, and
+        # backends that can write per file or per row only write what changed
+        start = time.perf_counter()
+        stats = self.capture_save(full)()
+        stats.seconds = time.perf_counter() - start
+        self.last_save_stats = stats
+        logging.info(f"Saved data: {stats}", extra={'event': 'save', 'seconds': round(stats.seconds, 3)})
+        return stats
+
+    def capture_save(self, full=False):
+        # First half of save_data: with every operation locked out, the backend copies what it
+        # is about to write and the dirty sets start over. Returns a function that writes the
+        # copy and returns a SaveStats; it never touches the library, so any thread can run it.
+        with self.locks.hold_all():
+            if not full and not self.dirty_books and not self.dirty_users:
+                return lambda: storage.SaveStats(skipped=True)
+            write = self.storage.capture(self, None if full else self.dirty_books, None if full else self.dirty_users)
+            self.dirty_books = set()
+            self.dirty_users = set()
+        return write
+
+    def load_data(self):
+        start = time.perf_counter()
+        self.storage.load(self)
+        self._rebuild_circulation_indexes()
+        loans = sum(len(user.borrowed_books) for user in self.users.values())
+        seconds = time.perf_counter() - start
+        # One summary event per startup, however big the catalog
+        logging.info(f"Loaded library: {len(self.books_by_id)} books, {len(self.users)} users, {loans} loans in {seconds:.3f} s",
+                     extra={'event': 'load', 'books': len(self.books_by_id), 'users': len(self.users), 'loans': loans,
+                            'seconds': round(seconds, 3)})
+
+    def export_excel(self, books_path=BOOKS_FILE, users_path=USERS_FILE):
+        self.export_books_excel(books_path)
+        self.export_users_excel(users_path)
+
+    def export_books_excel(self, books_path=BOOKS_FILE):
+        # Save books to an Excel file
+        self.books_frame().to_excel(books_path, index=False)
+
+    def books_frame(self):
+        books_data = {
+            'book_id': [],
+            'title': [],
+            'author': [],
+            'copies': []
+        }
+        for book in self.books_by_id.values():
+            books_data['book_id'].append(book.book_id)
+            books_data['title'].append(book.title)
+            books_data['author'].append(book.author)
+            books_data['copies'].append(book.copies)
+
+        return pd.DataFrame(books_data)
+
+    def export_users_excel(self, users_path=USERS_FILE):
+        # Save users to an Excel file, with the unpaid overdue requests on a second sheet
+        storage.write_sheets(self.users_sheets(), users_path)
+
+    def users_sheets(self):
+        # Loans and overdue requests change together, so they share one workbook
+        return {self.FIRST_SHEET: self.users_frame(), self.OVERDUE_SHEET: self.overdue_frame()}
+
+    def users_frame(self):
+        users_data = {
+            'user_id': [],
+            'name': [],
+            'borrowed_books': []
+        }
+        for user in self.users.values():
+            borrowed_books = ';'.join(f"{book.book_id},{date},{due_date}" for book, date, due_date in user.borrowed_books.values())
+            users_data['user_id'].append(user.user_id)
+            users_data['name'].append(user.name)
+            users_data['borrowed_books'].append(borrowed_books)
+
+        return pd.DataFrame(users_data)
+
+    def overdue_frame(self):
+        # A request holds the copy until it is paid, so it has to survive a restart with the loans
+        requests = list(self.overdue_requests)
+        return pd.DataFrame({
+            'user_id': [request.user.user_id for request in requests],
+            'book_id': [request.book.book_id for request in requests],
+            'days_overdue': [request.days_overdue for request in requests],
+            'paid': [request.paid for request in requests],
+        })
+
+    def import_excel(self, books_path=BOOKS_FILE, users_path=USERS_FILE):
+        try:
+            # Load books from the books.xlsx file
+            books_df = pd.read_excel(books_path, dtype={'book_id': 'int64', 'copies': 'int64'})
+            self.load_books_frame(books_df)
+
+            # Load users from the users.xlsx file, and the overdue requests if the workbook has them
+            with pd.ExcelFile(users_path) as workbook:
+                users_df = workbook.parse(0, dtype={'user_id': 'int64', 'borrowed_books': object})
+                self.load_users_frame(users_df)
+                if self.OVERDUE_SHEET in workbook.sheet_names:
+                    self.load_overdue_frame(workbook.parse(self.OVERDUE_SHEET))
+
+        except FileNotFoundError:
+            print("No saved data found.")
+
+    def load_books_frame(self, books_df):
+        # Column-wise load: convert each column once, then build all books in a single pass
+        book_ids = books_df['book_id'].to_numpy(dtype='int64').tolist()
+        titles = books_df['title'].astype(str).tolist()  # Ensure title and author are treated as strings
+        authors = books_df['author'].astype(str).tolist()
+        copies = books_df['copies'].to_numpy(dtype='int64').tolist()
+
+        self.add_books_bulk(list(map(Book, book_ids, titles, authors, copies)))
+
+    def add_books_bulk(self, books):
+        self.books_by_id.update((book.book_id, book) for book in books)
+        all_books = sorted(self.books_by_id.values(), key=lambda book: book.book_id)
+        # Build the balanced tree and the search indexes in one pass instead of row by row
+        self.book_bst = BookBST.build_from_sorted(all_books)
+        self.catalog_index.build(books)
+        self.prefix_index.build(books)
+        logging.debug(f"Loaded {len(books)} books")  # load_data logs one summary for the whole load
+
+    def load_users_frame(self, users_df):
+        users_df = users_df.reset_index(drop=True)
+        user_ids = users_df['user_id'].to_numpy(dtype='int64').tolist()
+        users = list(map(User, user_ids, users_df['name'].tolist()))
+
+        # borrowed_books is encoded as "book_id,borrow_date,due_date;..." per user
+        encoded = users_df['borrowed_books'].dropna().astype(str)
+        loans = encoded[encoded != ''].str.split(';').explode()
+        loans = loans[loans.str.count(',') == 2]
+        if not loans.empty:
+            # Every remaining entry has exactly three fields, so one join/split yields an (n, 3) array
+            fields = np.array(','.join(loans.tolist()).split(',')).reshape(-1, 3)
+            book_ids, days, parsed = _parse_loan_fields(fields)
+            known = parsed & np.isin(book_ids, np.fromiter(self.books_by_id, dtype='int64', count=len(self.books_by_id)))
+            days = days[known]
+            known_ids = book_ids[known].tolist()
+            borrowed = list(map(Loan, map(self.books_by_id.__getitem__, known_ids), days[:, 0].tolist(), days[:, 1].tolist()))
+            # explode keeps rows grouped by user, so each user's loans are one contiguous slice
+            rows = loans.index.to_numpy()[known]
+            if len(rows):
+                starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+                ends = np.r_[starts[1:], len(rows)]
+                for row, start, end in zip(rows[starts].tolist(), starts.tolist(), ends.tolist()):
+                    users[row].borrowed_books = dict(zip(known_ids[start:end], borrowed[start:end]))
+
+        self.add_users_bulk(users)
+
+    def load_overdue_frame(self, overdue_df):
+        for user_id, book_id, days_overdue, paid in overdue_df[['user_id', 'book_id', 'days_overdue', 'paid']].itertuples(index=False):
+            user = self.users.get(int(user_id))
+            book = self.books_by_id.get(int(book_id))
+            if user and book:
+                request = OverdueRequest(user, book, int(days_overdue))
+                request.paid = bool(paid)
+                self.overdue_requests.add(request)
+
+    def add_users_bulk(self, users):
+        self.users.update((user.user_id, user) for user in users)
+        loan_count = sum(len(user.borrowed_books) for user in users)
+        logging.debug(f"Loaded {len(users)} users with {loan_count} borrowed books")
+
@@ -0,0 +1,101 @@
+import heapq
+import logging
+import threading
+
+
+class ActiveLoanIndex:
+    # book_id -> min-heap of (due_day, user_id) for every copy currently on loan, so
+    # the earliest date a copy comes back is heap[0]. A book rarely has more than a
+    # handful of copies out, so returns remove their entry directly and re-heapify.
+    def __init__(self):
+        self._heaps = {}
+
+    def add(self, book_id, due_day, user_id):
+        heapq.heappush(self._heaps.setdefault(book_id, []), (due_day, user_id))
+
+    def remove(self, book_id, due_day, user_id):
+        heap = self._heaps.get(book_id)
+        if heap and (due_day, user_id) in heap:
+            heap.remove((due_day, user_id))
+            if heap:
+                heapq.heapify(heap)
+            else:
+                del self._heaps[book_id]
+
+    def earliest_due(self, book_id):
+        # Day ordinal of the earliest due date among the active loans, or None
+        heap = self._heaps.get(book_id)
+        return heap[0][0] if heap else None
+
+    def build(self, users):
+        self._heaps = {}
+        for user in users:
+            for loan in user.borrowed_books.values():
+                self._heaps.setdefault(loan.book.book_id, []).append((loan.due_day, user.user_id))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+
+class DueQueue:
+    # Global min-heap of (due_day, user_id, book_id) over every active loan that is not
+    # overdue yet. Returns only drop the loan from _live; their stale heap entries are
+    # skipped when they reach the top, and the heap is rebuilt once stale entries dominate.
+    # Not locked itself, Library guards it with overdue_lock.
+    def __init__(self):
+        self._heap = []
+        self._live = {}  # (user_id, book_id) -> due_day
+
+    def __len__(self):
+        return len(self._live)
+
+    def push(self, user_id, book_id, due_day):
+        self._live[(user_id, book_id)] = due_day
+        heapq.heappush(self._heap, (due_day, user_id, book_id))
+
+    def discard(self, user_id, book_id):
+        if self._live.pop((user_id, book_id), None) is not None and len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [(due_day, user_id, book_id) for (user_id, book_id), due_day in self._live.items()]
+            heapq.heapify(self._heap)
+
+    def pop_due(self, today):
+        # Removes and returns (user_id, book_id, due_day) for every live loan due before today
+        due = []
+        heap, live = self._heap, self._live
+        while heap and heap[0][0] < today:
+            due_day, user_id, book_id = heapq.heappop(heap)
+            if live.get((user_id, book_id)) == due_day:
+                del live[(user_id, book_id)]
+                due.append((user_id, book_id, due_day))
+        return due
+
+    def build(self, users):
+        self._live = {(user.user_id, loan.book.book_id): loan.due_day for user in users for loan in user.borrowed_books.values()}
+        self._heap = [(due_day, user_id, book_id) for (user_id, book_id), due_day in self._live.items()]
+        heapq.heapify(self._heap)
+
+
+class OverdueSweeper:
+    # Calls library.sweep_overdue() every interval seconds on a daemon thread, so loans
+    # that go overdue while still out show up without the Tk main loop doing the work
+    def __init__(self, library, interval=60):
+        self.library = library
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='overdue-sweeper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.library.sweep_overdue()
+            except Exception:
+                logging.exception("Overdue sweep failed")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,34 @@
+import threading
+from contextlib import contextmanager
+
+
+class LockStripes:
+    # Per-user and per-book locks without a lock object per record: ids hash onto a fixed
+    # pool of stripes. hold() always takes user stripes before book stripes and each kind
+    # in ascending stripe order, so two operations can never wait on each other in a cycle.
+    # The stripes are reentrant, so an operation may call another that takes the same ones.
+    def __init__(self, stripes=64):
+        self.stripes = stripes
+        self._users = [threading.RLock() for _ in range(stripes)]
+        self._books = [threading.RLock() for _ in range(stripes)]
+
+    def _locks_for(self, user_ids, book_ids):
+        return ([self._users[i] for i in sorted({hash(user_id) % self.stripes for user_id in user_ids})]
+                + [self._books[i] for i in sorted({hash(book_id) % self.stripes for book_id in book_ids})])
+
+    @contextmanager
+    def _holding(self, locks):
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def hold(self, users=(), books=()):
+        return self._holding(self._locks_for(users, books))
+
+    def hold_all(self):
+        # Excludes every operation, e.g. while a snapshot of the whole library is taken
+        return self._holding(self._users + self._books)
@@ -0,0 +1,253 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+
+import logging_setup
+
+# Circulation statistics from library_management.log and its rotated segments. Lines are
+# streamed one at a time, so memory depends on the number of distinct books, users and
+# days, not on the size of the log. Both formats are understood: the JSON lines written
+# by logging_setup and the older "2024-10-27 23:15:10,353:INFO:Borrowed book: ..." text
+# lines. The aggregates and the byte offset reached in each file are kept in a state
+# file, so the next run only reads what was appended (or rotated in) since.
+#
+#     python log_analytics.py                 # update the state and print the report
+#     python log_analytics.py --json --top 20
+#     python log_analytics.py --reset         # forget the state and rescan everything
+
+STATE_FILE = 'log_analytics.state.json'
+HEAD_BYTES = 256
+
+TEXT_LINE = re.compile(r'^(?P<day>\d{4}-\d{2}-\d{2}) [\d:,]+:(?P<level>[A-Z]+):(?P<msg>.*)$')
+BORROWED = re.compile(r'^Borrowed book: (?P<title>.*) \(ID: (?P<book_id>\d+)\) by user (?P<name>.*) \(ID: (?P<user_id>\d+)\)$')
+RETURNED = re.compile(r'^Requested return of overdue book: (?P<title>.*) \(ID: (?P<book_id>\d+)\) by user (?P<name>.*) \(ID: (?P<user_id>\d+)\)$')
+RESERVED = re.compile(r'^User\s+(?P<name>.*) \(ID: (?P<user_id>\d+)\) reserved book: (?P<title>.*) \(ID: (?P<book_id>\d+)\)$')
+PAID = re.compile(r"^Overdue request for book '(?P<title>.*)' marked as paid by user (?P<name>.*)\.$")
+
+
+class CirculationStats:
+    # Running totals; everything is keyed by id, with the last seen title or name kept aside
+    COUNTERS = ('borrows_by_book', 'borrows_by_user', 'borrows_by_day', 'returns_by_day')
+
+    def __init__(self):
+        self.borrows_by_book = Counter()
+        self.borrows_by_user = Counter()
+        self.borrows_by_day = Counter()
+        self.returns_by_day = Counter()
+        self.titles = {}
+        self.names = {}
+        self.returns = 0
+        self.returns_with_days = 0  # Returns logged with days_overdue (JSON lines)
+        self.overdue_returns = 0
+        self.reservations = 0
+        self.paid = 0
+        self.lines = 0
+
+    def borrow(self, day, user_id, book_id):
+        self.borrows_by_book[book_id] += 1
+        self.borrows_by_user[user_id] += 1
+        self.borrows_by_day[day] += 1
+
+    def returned(self, day, days_overdue=None):
+        self.returns += 1
+        self.returns_by_day[day] += 1
+        if days_overdue is not None:
+            self.returns_with_days += 1
+            self.overdue_returns += days_overdue > 0
+
+    def add_text_line(self, line):
+        match = TEXT_LINE.match(line)
+        if not match:
+            return  # Traceback lines and other continuation text
+        day, msg = match['day'], match['msg']
+        if found := BORROWED.match(msg):
+            user_id, book_id = int(found['user_id']), int(found['book_id'])
+            self.titles[book_id], self.names[user_id] = found['title'], found['name']
+            self.borrow(day, user_id, book_id)
+        elif found := RETURNED.match(msg):
+            # The old message says "overdue" for every return, so it does not tell which were
+            self.titles[int(found['book_id'])] = found['title']
+            self.returned(day)
+        elif found := RESERVED.match(msg):
+            self.titles[int(found['book_id'])] = found['title']
+            self.reservations += 1
+        elif PAID.match(msg):
+            self.paid += 1
+
+    def add_event(self, entry):
+        event = entry.get('event')
+        day = str(entry.get('ts', ''))[:10]
+        if 'title' in entry and 'book_id' in entry:
+            self.titles[entry['book_id']] = entry['title']
+        if 'user_name' in entry and 'user_id' in entry:
+            self.names[entry['user_id']] = entry['user_name']
+        if event == 'borrow':
+            self.borrow(day, entry['user_id'], entry['book_id'])
+        elif event == 'borrow_many':
+            for user_id, book_id in entry.get('borrowed', ()):
+                self.borrow(day, user_id, book_id)
+        elif event == 'return':
+            self.returned(day, entry.get('days_overdue'))
+        elif event == 'return_many':
+            for user_id, book_id, days_overdue in entry.get('returned', ()):
+                self.returned(day, days_overdue)
+        elif event == 'reserve':
+            self.reservations += 1
+        elif event == 'mark_paid':
+            self.paid += 1
+
+    def add_line(self, line):
+        self.lines += 1
+        if line.startswith('{'):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                return
+            self.add_event(entry)
+        else:
+            self.add_text_line(line)
+
+    def overdue_rate(self):
+        # Share of returns that came back late, from the returns whose lateness was logged;
+        # for an old text-only log, paid overdue requests per return is the best estimate
+        if self.returns_with_days:
+            return self.overdue_returns / self.returns_with_days
+        return self.paid / self.returns if self.returns else 0.0
+
+    def to_json(self):
+        state = {name: dict(getattr(self, name)) for name in self.COUNTERS}
+        state['titles'] = self.titles
+        state['names'] = self.names
+        state.update((name, getattr(self, name)) for name in
+                     ('returns', 'returns_with_days', 'overdue_returns', 'reservations', 'paid', 'lines'))
+        return state
+
+    @classmethod
+    def from_json(cls, state):
+        stats = cls()
+        # JSON object keys are strings; ids go back to ints, days stay strings
+        stats.borrows_by_book = Counter({int(key): count for key, count in state['borrows_by_book'].items()})
+        stats.borrows_by_user = Counter({int(key): count for key, count in state['borrows_by_user'].items()})
+        stats.borrows_by_day = Counter(state['borrows_by_day'])
+        stats.returns_by_day = Counter(state['returns_by_day'])
+        stats.titles = {int(key): title for key, title in state['titles'].items()}
+        stats.names = {int(key): name for key, name in state['names'].items()}
+        for name in ('returns', 'returns_with_days', 'overdue_returns', 'reservations', 'paid', 'lines'):
+            setattr(stats, name, state[name])
+        return stats
+
+    def report(self, top=10):
+        return {
+            'lines': self.lines,
+            'borrows': sum(self.borrows_by_day.values()),
+            'returns': self.returns,
+            'reservations': self.reservations,
+            'overdue_paid': self.paid,
+            'overdue_rate': round(self.overdue_rate(), 4),
+            'top_titles': [[self.titles.get(book_id, f"Book {book_id}"), count]
+                           for book_id, count in self.borrows_by_book.most_common(top)],
+            'top_users': [[self.names.get(user_id, f"User {user_id}"), count]
+                          for user_id, count in self.borrows_by_user.most_common(top)],
+            'borrows_by_day': dict(sorted(self.borrows_by_day.items())),
+            'returns_by_day': dict(sorted(self.returns_by_day.items())),
+        }
+
+
+def log_files(path):
+    # The live log and its rotated segments, oldest first (path.5, ..., path.1, path)
+    rotated = []
+    for name in glob.glob(glob.escape(path) + '.*'):
+        suffix = name[len(path) + 1:]
+        if suffix.isdigit():
+            rotated.append((int(suffix), name))
+    return [name for number, name in sorted(rotated, reverse=True)] + ([path] if os.path.exists(path) else [])
+
+
+def file_key(path):
+    # Rotation renames files, so a file is known by its inode rather than its name
+    stat = os.stat(path)
+    return f"{stat.st_dev}:{stat.st_ino}", stat.st_size
+
+
+def head_hash(path, length):
+    # Hash of the first bytes already read, to tell a rotated file from a new one that reused its inode
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read(min(length, HEAD_BYTES))).hexdigest()
+
+
+def read_lines(path, offset):
+    # Yields (complete line, offset after it) from offset on; a partly written last line is left for next time
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                return
+            offset += len(raw)
+            yield raw.decode('utf-8', errors='replace').rstrip('\r\n'), offset
+
+
+def analyze(log_path=logging_setup.LOG_FILE, state_path=STATE_FILE, reset=False):
+    # Updates the saved statistics with everything new in the log and returns them
+    state = None
+    if not reset and os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    stats = CirculationStats.from_json(state['stats']) if state else CirculationStats()
+    offsets = state['offsets'] if state else {}
+
+    new_offsets = {}
+    for path in log_files(log_path):
+        key, size = file_key(path)
+        seen = offsets.get(key)
+        offset = 0
+        if seen and seen['offset'] <= size and head_hash(path, seen['offset']) == seen['head']:
+            offset = seen['offset']
+        for line, offset in read_lines(path, offset):
+            stats.add_line(line)
+        new_offsets[key] = {'offset': offset, 'head': head_hash(path, offset)}
+
+    # Files that rotated out of existence are simply dropped from the offsets
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'offsets': new_offsets, 'stats': stats.to_json()}, f)
+    os.replace(tmp_path, state_path)
+    return stats
+
+
+def print_report(report):
+    print(f"{report['lines']:,} log lines: {report['borrows']:,} borrows, {report['returns']:,} returns, "
+          f"{report['reservations']:,} reservations, {report['overdue_paid']:,} overdue requests paid")
+    print(f"overdue rate: {report['overdue_rate']:.1%}")
+    print("most borrowed titles:")
+    for title, count in report['top_titles']:
+        print(f"  {count:6,}  {title}")
+    print("most active users:")
+    for name, count in report['top_users']:
+        print(f"  {count:6,}  {name}")
+    print("borrows per day:")
+    for day, count in report['borrows_by_day'].items():
+        print(f"  {day}  {count:6,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Circulation statistics from the library log")
+    parser.add_argument('--log', default=logging_setup.LOG_FILE, help="log file; rotated segments next to it are read too")
+    parser.add_argument('--state', default=STATE_FILE, help="where totals and read offsets are kept between runs")
+    parser.add_argument('--reset', action='store_true', help="ignore the saved state and rescan every file")
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = analyze(args.log, args.state, args.reset).report(args.top)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
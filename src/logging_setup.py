@@ -0,0 +1,51 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+
+# Non-blocking, structured logging for the app, the server and the command line tools.
+# Every logging call only puts the record on a queue; a QueueListener thread formats it
+# as one JSON object per line and writes it to a size-rotated file. Fields passed with
+# extra= (event, user_id, book_id, ...) become keys of the JSON object:
+#     {"ts": "2026-10-17 09:30:12,345", "level": "INFO", "msg": "Borrowed book: ...",
+#      "event": "borrow", "user_id": 101, "book_id": 2, "title": "..."}
+
+LOG_FILE = 'library_management.log'
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+# Attributes every LogRecord has; anything else on a record came in through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': self.formatTime(record), 'level': record.levelname, 'msg': record.getMessage()}
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(path=LOG_FILE, level=logging.INFO, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT):
+    # Replaces the root handlers with a queue and starts the writer thread; returns the
+    # QueueListener, which is also stopped (and its queue drained) at interpreter exit
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding='utf-8', delay=True)
+    file_handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+
+    def stop_at_exit():
+        if listener._thread is not None:  # stop() must not run twice, and callers may have stopped it
+            listener.stop()
+
+    atexit.register(stop_at_exit)
+    return listener
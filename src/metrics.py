@@ -0,0 +1,184 @@
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+from library import BookBST, Library
+
+# Latency metrics for the Library and BookBST hot paths. enable() wraps the listed
+# methods on their classes with a timer that feeds a fixed-bucket histogram per
+# operation; disable() puts the original methods back. While disabled nothing is
+# wrapped, so instrumentation costs nothing at all unless it is switched on.
+#
+# The numbers are shown on the admin Metrics screen and written periodically as a
+# Prometheus text file (for node_exporter's textfile collector or any scraper).
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROMETHEUS_FILE = 'library_metrics.prom'
+
+HOT_PATHS = {
+    Library: ('load_data', 'save_data', 'capture_save', 'add_book', 'borrow_book', 'return_book', 'reserve_book',
+              'borrow_many', 'return_many', 'settle_overdue', 'sweep_overdue', 'search_by_id', 'search_by_title',
+              'search_by_author', 'suggest'),
+    BookBST: ('search_by_id', 'search_by_title', 'search_by_author', 'insert', 'delete'),
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, failed=False):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+            self.errors += failed
+
+    def clear(self):
+        with self._lock:
+            self.counts = [0] * len(self.counts)
+            self.count = 0
+            self.sum = 0.0
+            self.errors = 0
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation; good to a bucket's width
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return 0.0
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._originals = []  # (cls, name, original attribute) for disable()
+
+    @property
+    def enabled(self):
+        return bool(self._originals)
+
+    def histogram(self, name):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            return histogram
+
+    def instrument(self, cls, names, prefix=None):
+        prefix = prefix or cls.__name__
+        for name in names:
+            original = cls.__dict__[name]
+            setattr(cls, name, self._timed(f"{prefix}.{name}", original))
+            self._originals.append((cls, name, original))
+
+    def _timed(self, op, function):
+        histogram = self.histogram(op)
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                histogram.observe(perf_counter() - start, failed)
+
+        return timed
+
+    def enable(self, targets=None):
+        if not self.enabled:
+            for cls, names in (targets or HOT_PATHS).items():
+                self.instrument(cls, names)
+
+    def disable(self):
+        while self._originals:
+            cls, name, original = self._originals.pop()
+            setattr(cls, name, original)
+
+    def reset(self):
+        for histogram in list(self.histograms.values()):
+            histogram.clear()
+
+    def rows(self):
+        # (op, count, errors, mean s, p50 s, p99 s, total s) per operation that ran
+        rows = []
+        for op, histogram in sorted(self.histograms.items()):
+            if histogram.count:
+                rows.append((op, histogram.count, histogram.errors, histogram.sum / histogram.count,
+                             histogram.quantile(0.5), histogram.quantile(0.99), histogram.sum))
+        return rows
+
+    def prometheus_text(self):
+        lines = ['# HELP library_operation_seconds Time spent in library operations.',
+                 '# TYPE library_operation_seconds histogram']
+        for op, histogram in sorted(self.histograms.items()):
+            with histogram._lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'library_operation_seconds_bucket{{op="{op}",le="{bound}"}} {cumulative}')
+            lines.append(f'library_operation_seconds_sum{{op="{op}"}} {total}')
+            lines.append(f'library_operation_seconds_count{{op="{op}"}} {count}')
+        lines += ['# HELP library_operation_errors_total Library operations that raised.',
+                  '# TYPE library_operation_errors_total counter']
+        for op, histogram in sorted(self.histograms.items()):
+            lines.append(f'library_operation_errors_total{{op="{op}"}} {histogram.errors}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=PROMETHEUS_FILE):
+        # Renamed into place, so a scraper never reads a half-written file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+METRICS = Metrics()
+
+
+class MetricsWriter:
+    # Writes the Prometheus text file every interval seconds on a daemon thread
+    def __init__(self, metrics=METRICS, path=PROMETHEUS_FILE, interval=15):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.metrics.write_prometheus(self.path)
+        except OSError:
+            logging.exception("Writing metrics failed")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()  # Leave the final numbers behind
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class OverdueStore:
+    # Open overdue requests keyed by a request_id assigned on add, with secondary
+    # indexes by user and by book so settling or looking up a request never scans
+    # the whole collection. Iterating yields requests in the order they were added.
+    def __init__(self):
+        self._requests = {}
+        self._by_user = {}  # user_id -> {request_id: None}
+        self._by_book = {}  # book_id -> {request_id: None}
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self._requests)
+
+    def __iter__(self):
+        return iter(list(self._requests.values()))
+
+    def __contains__(self, request_id):
+        return request_id in self._requests
+
+    def add(self, request):
+        request.request_id = self._next_id
+        self._next_id += 1
+        self._requests[request.request_id] = request
+        self._by_user.setdefault(request.user.user_id, {})[request.request_id] = None
+        self._by_book.setdefault(request.book.book_id, {})[request.request_id] = None
+        return request.request_id
+
+    def get(self, request_id):
+        return self._requests.get(request_id)
+
+    def remove(self, request_id):
+        request = self._requests.pop(request_id, None)
+        if request is not None:
+            for index, key in ((self._by_user, request.user.user_id), (self._by_book, request.book.book_id)):
+                ids = index[key]
+                del ids[request_id]
+                if not ids:
+                    del index[key]
+        return request
+
+    def for_user(self, user_id):
+        return [self._requests[request_id] for request_id in self._by_user.get(user_id, ())]
+
+    def for_book(self, book_id):
+        return [self._requests[request_id] for request_id in self._by_book.get(book_id, ())]
+
+    def find(self, user_id, book_id, days_overdue):
+        # First request matching the persisted (user, book, days) key, as the backends identify them
+        for request in self.for_user(user_id):
+            if request.book.book_id == book_id and request.days_overdue == days_overdue:
+                return request
+        return None
+
+    def clear(self):
+        self._requests.clear()
+        self._by_user.clear()
+        self._by_book.clear()
+
+
+class FeeSchedule:
+    # Tiered per-day fees: tiers is a list of (first_day, rate) sorted by first_day, and
+    # every overdue day past first_day is charged at that tier's rate until the next tier
+    # starts. FeeSchedule([(0, 1), (7, 2), (30, 5)], cap=500) charges Rs.1 for each of the
+    # first 7 days, Rs.2 for days 8-30 and Rs.5 after that, never more than Rs.500.
+    def __init__(self, tiers=((0, 1),), cap=None):
+        tiers = sorted(tiers)
+        if not tiers or tiers[0][0] != 0:
+            raise ValueError("The first fee tier must start at day 0")
+        self.tiers = tiers
+        self.cap = cap
+        self._starts = np.array([start for start, rate in tiers], dtype=np.int64)
+        rates = [rate for start, rate in tiers]
+        # Whole-rupee schedules stay in integer arithmetic so fees print as before
+        self._rates = np.array(rates, dtype=np.int64 if all(float(rate).is_integer() for rate in rates) else np.float64)
+        self._widths = np.diff(np.append(self._starts, np.iinfo(np.int64).max))
+
+    def amounts(self, days_overdue):
+        # Fees for a whole sequence of day counts in one array pass
+        days = np.asarray(days_overdue, dtype=np.int64).reshape(-1, 1)
+        charged_days = np.clip(days - self._starts, 0, self._widths)
+        amounts = charged_days @ self._rates
+        if self.cap is not None:
+            amounts = np.minimum(amounts, self.cap)
+        return amounts
+
+    def amount(self, days_overdue):
+        return self.amounts([days_overdue])[0].item()
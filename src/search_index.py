@@ -0,0 +1,182 @@
+import bisect
+import unicodedata
+
+
+class CatalogIndex:
+    # Inverted index over book titles and authors. For each field it keeps the
+    # lowercased text per book, whole-token postings and 3-gram postings. A query
+    # intersects the postings it implies and then checks the surviving candidates
+    # with a plain substring test, so results match `query.lower() in text.lower()`.
+    FIELDS = ('title', 'author')
+    NGRAM = 3
+
+    def __init__(self):
+        self._text = {field: {} for field in self.FIELDS}    # book_id -> lowercased text
+        self._tokens = {field: {} for field in self.FIELDS}  # token -> set of book_ids
+        self._grams = {field: {} for field in self.FIELDS}   # n-gram -> set of book_ids
+
+    def __len__(self):
+        return len(self._text['title'])
+
+    def _grams_of(self, text):
+        n = self.NGRAM
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def add(self, book):
+        if book.book_id in self._text['title']:
+            self.remove(book.book_id)
+        for field in self.FIELDS:
+            text = str(getattr(book, field)).lower()
+            self._text[field][book.book_id] = text
+            for token in set(text.split()):
+                self._tokens[field].setdefault(token, set()).add(book.book_id)
+            for gram in self._grams_of(text):
+                self._grams[field].setdefault(gram, set()).add(book.book_id)
+
+    def build(self, books):
+        # Bulk variant of add(): books already indexed are removed in one pass up front (a
+        # re-import), then every book is added with no per-book check and locals hoisted
+        n = self.NGRAM
+        books = {book.book_id: book for book in books}
+        for book_id in books.keys() & self._text['title'].keys():
+            self.remove(book_id)
+        for field in self.FIELDS:
+            texts, tokens, grams = self._text[field], self._tokens[field], self._grams[field]
+            for book in books.values():
+                text = str(getattr(book, field)).lower()
+                texts[book.book_id] = text
+                for token in set(text.split()):
+                    ids = tokens.get(token)
+                    if ids is None:
+                        tokens[token] = ids = set()
+                    ids.add(book.book_id)
+                for gram in {text[i:i + n] for i in range(len(text) - n + 1)}:
+                    ids = grams.get(gram)
+                    if ids is None:
+                        grams[gram] = ids = set()
+                    ids.add(book.book_id)
+
+    def remove(self, book_id):
+        for field in self.FIELDS:
+            text = self._text[field].pop(book_id, None)
+            if text is None:
+                continue
+            for postings, keys in ((self._tokens[field], set(text.split())), (self._grams[field], self._grams_of(text))):
+                for key in keys:
+                    ids = postings.get(key)
+                    if ids is not None:
+                        ids.discard(book_id)
+                        if not ids:
+                            del postings[key]
+
+    def search(self, field, query):
+        # Returns matching book_ids sorted ascending
+        query = query.lower()
+        texts = self._text[field]
+        postings = []
+
+        # Pieces of the query with whitespace on both sides must be whole tokens of the text
+        parts = query.split()
+        for i, part in enumerate(parts):
+            starts_inside = i > 0 or query[:1].isspace()
+            ends_inside = i < len(parts) - 1 or query[-1:].isspace()
+            if starts_inside and ends_inside:
+                postings.append(self._tokens[field].get(part, set()))
+
+        for gram in self._grams_of(query):
+            postings.append(self._grams[field].get(gram, set()))
+
+        if postings:
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for ids in postings[1:]:
+                if not candidates:
+                    break
+                candidates &= ids
+        else:
+            # Query too short to use the index, fall back to the cached lowercased text
+            candidates = texts.keys()
+
+        return sorted(book_id for book_id in candidates if query in texts[book_id])
+
+
+def normalize(text):
+    # Case-fold, strip accents and collapse whitespace so "Émile  Zola" matches "emile z"
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+class PrefixIndex:
+    # Sorted arrays of (normalized text, book_id) per field. A prefix lookup is one
+    # bisect plus a walk over at most k entries, so suggestions stay cheap while the
+    # user types regardless of catalog size.
+    FIELDS = ('title', 'author')
+
+    def __init__(self):
+        self._entries = {field: [] for field in self.FIELDS}
+        self._keys = {}  # book_id -> normalized key per field, needed to remove entries
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, book):
+        if book.book_id in self._keys:
+            self.remove(book.book_id)
+        keys = tuple(normalize(getattr(book, field)) for field in self.FIELDS)
+        self._keys[book.book_id] = keys
+        for field, key in zip(self.FIELDS, keys):
+            bisect.insort(self._entries[field], (key, book.book_id))
+
+    def build(self, books):
+        for book in books:
+            keys = tuple(normalize(getattr(book, field)) for field in self.FIELDS)
+            self._keys[book.book_id] = keys
+        for i, field in enumerate(self.FIELDS):
+            self._entries[field] = sorted((keys[i], book_id) for book_id, keys in self._keys.items())
+
+    def add_many(self, books):
+        # Batch add for imports: the new entries are appended and sorted in, and sorting two
+        # sorted runs is linear, so a batch costs O(n + k log k) instead of k insorts
+        books = {book.book_id: book for book in books}
+        replaced = books.keys() & self._keys.keys()
+        if len(replaced) <= 64:
+            for book_id in replaced:
+                self.remove(book_id)
+        else:
+            # Drop the old entries of re-imported books in one pass rather than one del each
+            for field in self.FIELDS:
+                self._entries[field] = [entry for entry in self._entries[field] if entry[1] not in replaced]
+        new_entries = {field: [] for field in self.FIELDS}
+        for book in books.values():
+            keys = tuple(normalize(getattr(book, field)) for field in self.FIELDS)
+            self._keys[book.book_id] = keys
+            for field, key in zip(self.FIELDS, keys):
+                new_entries[field].append((key, book.book_id))
+        for field, entries in new_entries.items():
+            entries.sort()
+            self._entries[field].extend(entries)
+            self._entries[field].sort()
+
+    def remove(self, book_id):
+        keys = self._keys.pop(book_id, None)
+        if keys is None:
+            return
+        for field, key in zip(self.FIELDS, keys):
+            entries = self._entries[field]
+            i = bisect.bisect_left(entries, (key, book_id))
+            if i < len(entries) and entries[i] == (key, book_id):
+                del entries[i]
+
+    def suggest(self, field, prefix, k=10):
+        # Returns up to k book_ids whose field starts with prefix, in alphabetical order
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        entries = self._entries[field]
+        results = []
+        i = bisect.bisect_left(entries, (prefix,))
+        while i < len(entries) and len(results) < k and entries[i][0].startswith(prefix):
+            results.append(entries[i][1])
+            i += 1
+        return results
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from urllib.parse import parse_qs, urlsplit
+
+import logging_setup
+import metrics
+import storage
+from library import Library, LibraryError, NotFoundError
+
+# HTTP/JSON service mode: one Library shared by every circulation desk. Requests are
+# handled on a single asyncio loop, so Library operations never run concurrently.
+# Writes that arrive in the same loop iteration are applied inside one storage
+# transaction, which the journal backend turns into a single record and the SQLite
+# backend into a single commit, and their responses go out once that batch commits.
+#
+#     GET  /books?id=|title=|author=     GET  /suggest?field=title&prefix=...&k=10
+#     GET  /books/<book_id>              GET  /overdue
+#     POST /borrow  {"user_id", "book_id"}
+#     POST /return  {"user_id", "book_id"}
+#     POST /reserve {"user_id", "book_id"}
+#     POST /overdue/<request_id>/pay
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+MAX_BODY = 64 * 1024  # Request bodies are a few ids; anything bigger is refused before it is read
+
+
+def book_json(book):
+    return {'book_id': book.book_id, 'title': book.title, 'author': book.author, 'copies': book.copies}
+
+
+def request_json(request, amount, returned):
+    return {'request_id': request.request_id, 'user_id': request.user.user_id, 'book_id': request.book.book_id,
+            'days_overdue': request.days_overdue, 'amount': amount, 'paid': request.paid, 'returned': returned}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class LibraryServer:
+    def __init__(self, library, sweep_interval=60):
+        self.library = library
+        self.sweep_interval = sweep_interval
+        self._pending = []  # (future, op, action, args) waiting for the next write batch
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=8080):
+        self._server = await asyncio.start_server(self.handle, host, port)
+        self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._sweeper.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _sweep_loop(self):
+        # The overdue sweep runs on the loop too, so it never races a request
+        while True:
+            self.library.sweep_overdue()
+            await asyncio.sleep(self.sweep_interval)
+
+    async def handle(self, reader, writer):
+        # One keep-alive connection: requests are answered in order until the client closes
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': "Malformed request line."}, False)
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    await self._respond(writer, 400, {'error': "Invalid Content-Length."}, False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {'error': f"Request body over {MAX_BODY} bytes."}, False)
+                    break
+                body = await reader.readexactly(length)
+
+                status, payload = await self.dispatch(method, target, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+        await writer.drain()
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if method == 'GET':
+                return 200, self.read(parts, query)
+            if method == 'POST':
+                return 200, await self.write_request(parts, json.loads(body) if body else {})
+            return 405, {'error': f"Method {method} not allowed."}
+        except NotFoundError as error:
+            return 404, {'error': str(error)}
+        except LibraryError as error:
+            return 409, {'error': str(error)}
+        except (BadRequest, ValueError, KeyError, TypeError) as error:
+            return 400, {'error': str(error) or "Bad request."}
+        except Exception:
+            logging.exception(f"Request failed: {method} {target}")
+            return 500, {'error': "Internal server error."}
+
+    def read(self, parts, query):
+        library = self.library
+        if parts == ['books']:
+            if 'id' in query:
+                book = library.search_by_id(int(query['id']))
+                books = [book] if book else []
+            elif 'title' in query:
+                books = library.search_by_title(query['title'])
+            elif 'author' in query:
+                books = library.search_by_author(query['author'])
+            else:
+                raise BadRequest("Search by id, title or author.")
+            return {'books': [book_json(book) for book in books]}
+        if len(parts) == 2 and parts[0] == 'books':
+            book = library.search_by_id(int(parts[1]))
+            if not book:
+                raise NotFoundError("Book not found.")
+            return book_json(book)
+        if parts == ['suggest']:
+            books = library.suggest(query.get('field', 'title'), query.get('prefix', ''), int(query.get('k', 10)))
+            return {'books': [book_json(book) for book in books]}
+        if parts == ['overdue']:
+            returned = list(library.overdue_requests)
+            outstanding = library.outstanding_overdue()
+            amounts = library.overdue_amounts(returned + outstanding).tolist()
+            return {'requests': [request_json(request, amount, True) for request, amount in zip(returned, amounts)]
+                                + [request_json(request, amount, False) for request, amount in zip(outstanding, amounts[len(returned):])]}
+        raise NotFoundError("No such resource.")
+
+    async def write_request(self, parts, data):
+        library = self.library
+        if parts in (['borrow'], ['return'], ['reserve']):
+            user_id, book_id = int(data['user_id']), int(data['book_id'])
+            if parts == ['borrow']:
+                result = await self.write('borrow', library.borrow_book, user_id, book_id)
+                return {'book': book_json(result.book), 'borrow_date': result.borrow_date, 'due_date': result.due_date}
+            if parts == ['return']:
+                result = await self.write('return', library.return_book, user_id, book_id)
+                request = result.overdue_request
+                return {'book': book_json(result.book), 'days_overdue': result.days_overdue,
+                        'overdue_request_id': request.request_id if request else None, 'overdue_amount': result.overdue_amount}
+            result = await self.write('reserve', library.reserve_book, user_id, book_id)
+            return {'book': book_json(result.book), 'tentative_date': result.tentative_date}
+        if len(parts) == 3 and parts[0] == 'overdue' and parts[2] == 'pay':
+            request = await self.write('mark_paid', library.settle_overdue, int(parts[1]))
+            return {'request_id': request.request_id, 'book': book_json(request.book), 'paid': request.paid}
+        raise NotFoundError("No such resource.")
+
+    def write(self, op, action, *args):
+        # Queues a mutating Library call for the current batch; resolves once it is committed
+        future = asyncio.get_running_loop().create_future()
+        if not self._pending:
+            asyncio.get_running_loop().call_soon(self._commit_batch)
+        self._pending.append((future, op, action, args))
+        return future
+
+    def _commit_batch(self):
+        batch, self._pending = self._pending, []
+        outcomes = []
+        op = batch[0][1] if len(batch) == 1 else 'batch'
+        try:
+            # Stripes before the storage transaction, the order every Library operation takes them
+            # in; holding all of them costs little next to the commit and covers any batch
+            with self.library.locks.hold_all(), self.library.storage.transaction(op):
+                for future, item_op, action, args in batch:
+                    try:
+                        outcomes.append((future, action(*args), None))
+                    except LibraryError as error:
+                        outcomes.append((future, None, error))  # Rejected before it changed anything
+                    except Exception as error:
+                        # Fails only this write: rolling the transaction back would leave the
+                        # others applied in memory but missing from storage
+                        logging.exception(f"Write {item_op} failed in a batch of {len(batch)}")
+                        outcomes.append((future, None, error))
+        except Exception as error:
+            logging.exception(f"Write batch of {len(batch)} operations failed")
+            for future, *rest in batch:
+                if not future.cancelled():
+                    future.set_exception(error)
+            return
+        for future, result, error in outcomes:
+            if future.cancelled():
+                continue  # The client went away; the operation itself still stands
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+async def serve(library, host, port, save_interval):
+    server = LibraryServer(library)
+    port = await server.start(host, port)
+    print(f"Serving on http://{host}:{port}", flush=True)
+    logging.info(f"Library server listening on {host}:{port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C still ends asyncio.run with KeyboardInterrupt
+
+    async def save_loop():
+        # Folds the journal into a fresh snapshot now and then, as exiting the GUI does. Only
+        # the capture runs on the loop; the file is written on a worker thread meanwhile.
+        while True:
+            await asyncio.sleep(save_interval)
+            write = library.capture_save()
+            try:
+                stats = await loop.run_in_executor(None, write)
+                logging.info(f"Saved data: {stats}")
+            except Exception:
+                logging.exception("Periodic save failed")
+
+    saver = loop.create_task(save_loop())
+    try:
+        await stop.wait()
+    finally:
+        saver.cancel()
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the library over HTTP/JSON")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help="0 picks a free port")
+    parser.add_argument('--storage', choices=sorted(storage.BACKENDS), default='journal',
+                        help="where library data is kept (default: %(default)s)")
+    parser.add_argument('--save-interval', type=float, default=300, help="seconds between snapshots")
+    parser.add_argument('--metrics', action='store_true',
+                        help=f"time the library hot paths and write them to {metrics.PROMETHEUS_FILE}")
+    args = parser.parse_args()
+
+    logging_setup.configure_logging()
+    metrics_writer = None
+    if args.metrics:
+        metrics.METRICS.enable()
+        metrics_writer = metrics.MetricsWriter()
+        metrics_writer.start()
+    library = Library(storage_backend=storage.BACKENDS[args.storage]())
+    try:
+        asyncio.run(serve(library, args.host, args.port, args.save_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        library.save_data()
+        library.storage.close()
+        if metrics_writer:
+            metrics_writer.stop()
+
+
+if __name__ == '__main__':
+    main()
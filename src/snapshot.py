@@ -0,0 +1,204 @@
+import argparse
+import mmap
+import os
+import struct
+from array import array
+from operator import attrgetter
+
+# Binary snapshot of a Library: a small header, a directory of named columns and the
+# column data itself. Numeric columns are fixed-width little-endian arrays aligned to
+# 8 bytes, text lives in one string table (offsets + UTF-8 blob), so a reader can mmap
+# the file and view every column in place instead of parsing a workbook.
+MAGIC = b'LMSSNAP\0'
+VERSION = 1
+HEADER = struct.Struct('<8sII')          # magic, version, number of columns
+DIRECTORY_ENTRY = struct.Struct('<24scxxxQQ')  # name, typecode, item count, byte offset
+ITEM_SIZES = {'q': 8, 'Q': 8, 'i': 4, 'B': 1}
+
+
+class StringTable:
+    def __init__(self):
+        self.index = {}
+        self.offsets = array('Q', [0])
+        self.data = bytearray()
+
+    def add(self, text):
+        text = str(text)
+        i = self.index.get(text)
+        if i is None:
+            i = self.index[text] = len(self.offsets) - 1
+            self.data += text.encode('utf-8')
+            self.offsets.append(len(self.data))
+        return i
+
+
+def capture_rows(library, journal_seq=0):
+    # Copy everything a snapshot holds into plain tuples. This is the only step that reads
+    # live objects, so it is kept to attribute reads; background saves run it with the
+    # library locked and leave the rest to columns_from_rows on another thread.
+    books = list(map(attrgetter('book_id', 'title', 'author', 'copies'), library.books_by_id.values()))
+    users = list(map(attrgetter('user_id', 'name'), library.users.values()))
+    loans = [(user.user_id, loan.book.book_id, loan.borrow_day, loan.due_day)
+             for user in library.users.values() for loan in user.borrowed_books.values()]
+    reservations = [(book.book_id, user_id) for book in library.books_by_id.values() if book.reservations
+                    for user_id in book.reservations]
+    overdue = [(request.user.user_id, request.book.book_id, request.days_overdue, request.paid)
+               for request in library.overdue_requests]
+    return books, users, loans, reservations, overdue, journal_seq
+
+
+def columns_from_rows(rows):
+    # Flatten captured rows into the snapshot's typed arrays and string table
+    books, users, loans, reservations, overdue, journal_seq = rows
+    strings = StringTable()
+    columns = {
+        'book.id': array('q', [book[0] for book in books]),
+        'book.title': array('Q', [strings.add(book[1]) for book in books]),
+        'book.author': array('Q', [strings.add(book[2]) for book in books]),
+        'book.copies': array('q', [book[3] for book in books]),
+        'user.id': array('q', [user[0] for user in users]),
+        'user.name': array('Q', [strings.add(user[1]) for user in users]),
+        'loan.user': array('q', [loan[0] for loan in loans]),
+        'loan.book': array('q', [loan[1] for loan in loans]),
+        'loan.borrowed': array('i', [loan[2] for loan in loans]),
+        'loan.due': array('i', [loan[3] for loan in loans]),
+        'reserve.book': array('q', [entry[0] for entry in reservations]),
+        'reserve.user': array('q', [entry[1] for entry in reservations]),
+        'overdue.user': array('q', [request[0] for request in overdue]),
+        'overdue.book': array('q', [request[1] for request in overdue]),
+        'overdue.days': array('q', [request[2] for request in overdue]),
+        'overdue.paid': array('B', [request[3] for request in overdue]),
+    }
+    columns['meta.journal_seq'] = array('q', [journal_seq])  # Last journal record folded into this snapshot
+    columns['strings.offsets'] = strings.offsets
+    columns['strings.data'] = array('B', bytes(strings.data))
+    return columns
+
+
+def collect_columns(library, journal_seq=0):
+    return columns_from_rows(capture_rows(library, journal_seq))
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def write_columns(columns, path):
+    # Write to a temporary file and rename it over the old snapshot, so a crash mid-write
+    # never leaves a truncated snapshot behind
+    offset = _align(HEADER.size + DIRECTORY_ENTRY.size * len(columns))
+    directory = []
+    for name, values in columns.items():
+        directory.append(DIRECTORY_ENTRY.pack(name.encode('ascii'), values.typecode.encode('ascii'), len(values), offset))
+        offset = _align(offset + len(values) * values.itemsize)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(columns)))
+        f.write(b''.join(directory))
+        for values in columns.values():
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(values.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotReader:
+    # Maps a snapshot file and exposes each column as a typed memoryview over the mapping.
+    # Use as a context manager; the views are only valid until it exits.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mapped)
+        self.columns = {}
+        magic, version, count = HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a library snapshot (version {VERSION})")
+        for i in range(count):
+            name, typecode, length, offset = DIRECTORY_ENTRY.unpack_from(self._view, HEADER.size + i * DIRECTORY_ENTRY.size)
+            typecode = typecode.decode('ascii')
+            size = length * ITEM_SIZES[typecode]
+            self.columns[name.rstrip(b'\0').decode('ascii')] = self._view[offset:offset + size].cast(typecode)
+
+    def __enter__(self):
+        return self.columns
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self._view.release()
+        self._mapped.close()
+
+
+def save_snapshot(library, path, journal_seq=0):
+    write_columns(collect_columns(library, journal_seq), path)
+
+
+def load_snapshot(library, path):
+    # Fills library from the snapshot and returns the journal sequence number it covers
+    from library import Book, Loan, OverdueRequest, User
+
+    with SnapshotReader(path) as columns:
+        offsets, data = columns['strings.offsets'], columns['strings.data']
+        strings = [bytes(data[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in range(len(offsets) - 1)]
+
+        library.add_books_bulk(list(map(
+            Book,
+            columns['book.id'].tolist(),
+            map(strings.__getitem__, columns['book.title'].tolist()),
+            map(strings.__getitem__, columns['book.author'].tolist()),
+            columns['book.copies'].tolist(),
+        )))
+        users = list(map(User, columns['user.id'].tolist(), map(strings.__getitem__, columns['user.name'].tolist())))
+        users_by_id = {user.user_id: user for user in users}
+        books_by_id = library.books_by_id
+
+        for user_id, book_id, borrowed, due in zip(columns['loan.user'].tolist(), columns['loan.book'].tolist(),
+                                                   columns['loan.borrowed'].tolist(), columns['loan.due'].tolist()):
+            book = books_by_id.get(book_id)
+            if book:  # Loans of books deleted since they were borrowed are dropped, as in the Excel loader
+                users_by_id[user_id].borrowed_books[book_id] = Loan(book, borrowed, due)
+        library.add_users_bulk(users)
+
+        for book_id, user_id in zip(columns['reserve.book'].tolist(), columns['reserve.user'].tolist()):
+            if book_id in books_by_id:
+                books_by_id[book_id].add_reservation(user_id)
+
+        for user_id, book_id, days, paid in zip(columns['overdue.user'].tolist(), columns['overdue.book'].tolist(),
+                                                columns['overdue.days'].tolist(), columns['overdue.paid'].tolist()):
+            if user_id in users_by_id and book_id in books_by_id:
+                request = OverdueRequest(users_by_id[user_id], books_by_id[book_id], days)
+                request.paid = bool(paid)
+                library.overdue_requests.add(request)
+
+        return columns['meta.journal_seq'][0] if 'meta.journal_seq' in columns else 0
+
+
+def main():
+    # Converter between the Excel workbooks and the binary snapshot
+    from library import Library
+
+    parser = argparse.ArgumentParser(description="Convert library data between Excel and the binary snapshot format")
+    parser.add_argument('direction', choices=['to-excel', 'from-excel'])
+    parser.add_argument('--snapshot', default='library.snapshot')
+    parser.add_argument('--books', default='books.xlsx')
+    parser.add_argument('--users', default='users.xlsx')
+    args = parser.parse_args()
+
+    library = Library(autoload=False)
+    if args.direction == 'to-excel':
+        load_snapshot(library, args.snapshot)
+        library.export_excel(args.books, args.users)
+    else:
+        library.import_excel(args.books, args.users)
+        save_snapshot(library, args.snapshot)
+    print(f"Converted {len(library.books_by_id)} books and {len(library.users)} users")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+import dates
+import journal
+import snapshot
+
+
+class SaveStats:
+    # What one Library.save_data call wrote
+    def __init__(self, books_written=0, users_written=0, files_written=0, skipped=False):
+        self.books_written = books_written
+        self.users_written = users_written
+        self.files_written = files_written
+        self.skipped = skipped
+        self.seconds = 0.0
+
+    def __repr__(self):
+        if self.skipped:
+            return "SaveStats(skipped, nothing changed)"
+        return (f"SaveStats(books={self.books_written}, users={self.users_written}, "
+                f"files={self.files_written}, seconds={self.seconds:.3f})")
+
+
+def write_sheets(sheets, path):
+    # One workbook with a sheet per {name: DataFrame} entry, in order
+    with pd.ExcelWriter(path) as writer:
+        for name, frame in sheets.items():
+            frame.to_excel(writer, sheet_name=name, index=False)
+
+
+class StorageBackend:
+    # Persistence behind Library. load() fills an empty Library and save() is called on
+    # exit. The row hooks are called by each Library operation inside transaction(), so
+    # backends that can write single records make every operation durable on its own;
+    # whole-file backends ignore them and write everything in save().
+    # save() gets the IDs of the books and users changed since the last save (None means
+    # everything) and returns a SaveStats.
+    def load(self, library):
+        raise NotImplementedError
+
+    def save(self, library, dirty_books=None, dirty_users=None):
+        raise NotImplementedError
+
+    def capture(self, library, dirty_books=None, dirty_users=None):
+        # save() split in two for background saves: capture() runs with the library locked,
+        # copies what save() would write and returns a function that writes the copy without
+        # touching the library. Backends that cannot split it simply save here.
+        stats = self.save(library, dirty_books, dirty_users)
+        return lambda: stats
+
+    @contextmanager
+    def transaction(self, op=None):
+        yield
+
+    def book_saved(self, book):
+        pass
+
+    def book_deleted(self, book_id):
+        pass
+
+    def user_saved(self, user):
+        pass
+
+    def user_deleted(self, user_id):
+        pass
+
+    def loan_saved(self, user_id, book_id, borrow_date, due_date):
+        pass
+
+    def loan_deleted(self, user_id, book_id):
+        pass
+
+    def reservation_added(self, book_id, user_id):
+        pass
+
+    def reservation_removed(self, book_id, user_id):
+        pass
+
+    def overdue_saved(self, request):
+        pass
+
+    def overdue_deleted(self, request):
+        pass
+
+    def close(self):
+        pass
+
+
+class ExcelBackend(StorageBackend):
+    # The original persistence: both workbooks rewritten in full on save. The unpaid
+    # overdue requests live on a second sheet of the users workbook.
+    def __init__(self, books_path='books.xlsx', users_path='users.xlsx'):
+        self.books_path = books_path
+        self.users_path = users_path
+
+    def load(self, library):
+        library.import_excel(self.books_path, self.users_path)
+
+    def save(self, library, dirty_books=None, dirty_users=None):
+        return self.capture(library, dirty_books, dirty_users)()
+
+    def capture(self, library, dirty_books=None, dirty_users=None):
+        # Each workbook is rewritten only when one of its records changed
+        stats = SaveStats()
+        frames = []
+        if dirty_books is None or dirty_books:
+            frames.append(({library.FIRST_SHEET: library.books_frame()}, self.books_path))
+            stats.books_written = len(library.books_by_id)
+            stats.files_written += 1
+        if dirty_users is None or dirty_users:
+            # Every change to an overdue request also marks its user dirty
+            frames.append((library.users_sheets(), self.users_path))
+            stats.users_written = len(library.users)
+            stats.files_written += 1
+
+        def write():
+            for sheets, path in frames:
+                # Written next to the workbook and renamed over it, so a crash never leaves half a file
+                root, extension = os.path.splitext(path)
+                tmp_path = f"{root}.tmp{extension}"  # pandas picks the Excel writer by extension
+                write_sheets(sheets, tmp_path)
+                os.replace(tmp_path, path)
+            return stats
+
+        return write
+
+
+class SnapshotBackend(StorageBackend):
+    # Binary snapshot written in full on save; falls back to the workbooks on first start
+    def __init__(self, path='library.snapshot', books_path='books.xlsx', users_path='users.xlsx'):
+        self.path = path
+        self.books_path = books_path
+        self.users_path = users_path
+        # Snapshot writes may finish out of order when they run in the background; each
+        # capture takes a ticket and a write older than the file on disk is dropped
+        self._write_lock = threading.Lock()
+        self._tickets = 0
+        self._written = 0
+
+    def load(self, library):
+        # Returns the journal sequence number the loaded state covers
+        if os.path.exists(self.path):
+            return snapshot.load_snapshot(library, self.path)
+        library.import_excel(self.books_path, self.users_path)
+        return 0
+
+    def save(self, library, dirty_books=None, dirty_users=None):
+        return self.capture(library, dirty_books, dirty_users)()
+
+    def capture(self, library, dirty_books=None, dirty_users=None):
+        return self._capture_snapshot(library)
+
+    def _capture_snapshot(self, library, journal_seq=0, sealed=()):
+        # The copy is plain row tuples; building the columns and writing them happens in write()
+        self._tickets += 1
+        ticket = self._tickets
+        rows = snapshot.capture_rows(library, journal_seq)
+        stats = SaveStats(len(library.books_by_id), len(library.users), 1)
+
+        def write():
+            with self._write_lock:
+                if ticket > self._written:
+                    snapshot.write_columns(snapshot.columns_from_rows(rows), self.path)
+                    self._written = ticket
+                self._drop_segments(sealed)
+            return stats
+
+        return write
+
+    def _drop_segments(self, sealed):
+        pass
+
+
+class JournalBackend(SnapshotBackend):
+    # Snapshot plus write-ahead journal. Every transaction becomes one journal record,
+    # startup loads the last snapshot and replays the journal tail, and once a segment
+    # holds compact_after records it is sealed and folded into a new snapshot by a
+    # background thread, so recovery never has to replay more than that.
+    def __init__(self, path='library.snapshot', journal_path='library.journal',
+                 books_path='books.xlsx', users_path='users.xlsx', compact_after=10000):
+        super().__init__(path, books_path, users_path)
+        self.journal = journal.Journal(journal_path)
+        self.compact_after = compact_after
+        self._changes = None
+        self._depth = 0
+        self._compactor = None
+        self._lock = threading.RLock()  # Held by the thread inside the outermost transaction
+
+    @contextmanager
+    def transaction(self, op=None):
+        with self._lock:
+            outermost = self._depth == 0
+            if outermost:
+                self._changes = []
+                self._op = op
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if outermost:
+                    self._changes = None
+                raise
+            self._depth -= 1
+            if outermost:
+                changes, self._changes = self._changes, None
+                if changes:
+                    self.journal.append(self._op, changes)
+                    if self.journal.records_in_segment >= self.compact_after:
+                        self.compact()
+
+    def _record(self, kind, data):
+        if self._changes is None:
+            with self.transaction(kind):
+                self._changes.append([kind, data])
+        else:
+            self._changes.append([kind, data])
+
+    def load(self, library):
+        seq = super().load(library)
+        last_seq = journal.replay(library, self.journal.read(after_seq=seq))
+        self.journal.open(last_seq or seq)
+        return self.journal.seq
+
+    def capture(self, library, dirty_books=None, dirty_users=None):
+        # Runs with the library locked, so it never waits for a running compaction: the
+        # tickets order the two snapshot writes and each drops only its own segments
+        sealed = self.journal.rotate()
+        return self._capture_snapshot(library, self.journal.seq, sealed)
+
+    def _drop_segments(self, sealed):
+        self.journal.remove(sealed)
+
+    def compact(self):
+        if self._compactor and self._compactor.is_alive():
+            return  # The running compaction picks this segment up next time
+        sealed = self.journal.rotate()
+        self._tickets += 1  # Orders the compacted snapshot with background saves
+        self._compactor = threading.Thread(target=self._compact, args=(sealed, self._tickets), name='journal-compactor', daemon=True)
+        self._compactor.start()
+
+    def _compact(self, sealed, ticket):
+        # Rebuilds the state from the files alone, so the live Library is never touched.
+        # Older segments still owned by a pending background save are replayed too; the
+        # ones that save already dropped are covered by the snapshot it wrote.
+        from library import Library
+
+        try:
+            with self._write_lock:
+                if ticket > self._written:
+                    library = Library(autoload=False, storage_backend=StorageBackend())
+                    seq = SnapshotBackend.load(self, library)
+                    pending = self.journal.segments_through(sealed[-1])
+                    seq = journal.replay(library, self.journal.read(pending, after_seq=seq)) or seq
+                    snapshot.save_snapshot(library, self.path, seq)
+                    self._written = ticket
+                    logging.info(f"Compacted journal into snapshot up to record {seq}")
+                self.journal.remove(sealed)
+        except Exception:
+            logging.exception("Journal compaction failed")
+
+    def wait_for_compaction(self):
+        if self._compactor:
+            self._compactor.join()
+
+    def book_saved(self, book):
+        self._record('book_saved', {'book_id': book.book_id, 'title': book.title, 'author': book.author, 'copies': book.copies})
+
+    def book_deleted(self, book_id):
+        self._record('book_deleted', {'book_id': book_id})
+
+    def user_saved(self, user):
+        self._record('user_saved', {'user_id': user.user_id, 'name': str(user.name)})
+
+    def user_deleted(self, user_id):
+        self._record('user_deleted', {'user_id': user_id})
+
+    def loan_saved(self, user_id, book_id, borrow_date, due_date):
+        self._record('loan_saved', {'user_id': user_id, 'book_id': book_id, 'borrow_date': borrow_date, 'due_date': due_date})
+
+    def loan_deleted(self, user_id, book_id):
+        self._record('loan_deleted', {'user_id': user_id, 'book_id': book_id})
+
+    def reservation_added(self, book_id, user_id):
+        self._record('reservation_added', {'book_id': book_id, 'user_id': user_id})
+
+    def reservation_removed(self, book_id, user_id):
+        self._record('reservation_removed', {'book_id': book_id, 'user_id': user_id})
+
+    def overdue_saved(self, request):
+        self._record('overdue_saved', {'user_id': request.user.user_id, 'book_id': request.book.book_id,
+                                       'days_overdue': request.days_overdue, 'paid': request.paid})
+
+    def overdue_deleted(self, request):
+        self._record('overdue_deleted', {'user_id': request.user.user_id, 'book_id': request.book.book_id,
+                                         'days_overdue': request.days_overdue})
+
+    def close(self):
+        self.wait_for_compaction()
+        self.journal.close()
+
+
+class SqliteBackend(StorageBackend):
+    # Every Library operation commits only the rows it changed, in one small transaction.
+    # save() has nothing left to write.
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS books (
+            book_id INTEGER PRIMARY KEY, title TEXT NOT NULL, author TEXT NOT NULL, copies INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS loans (
+            user_id INTEGER NOT NULL, book_id INTEGER NOT NULL, borrow_date TEXT NOT NULL, due_date TEXT NOT NULL,
+            PRIMARY KEY (user_id, book_id));
+        CREATE INDEX IF NOT EXISTS loans_book_id ON loans (book_id);
+        CREATE INDEX IF NOT EXISTS loans_due_date ON loans (due_date);
+        CREATE TABLE IF NOT EXISTS reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER NOT NULL, user_id INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS reservations_book_id ON reservations (book_id);
+        CREATE TABLE IF NOT EXISTS overdue_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, book_id INTEGER NOT NULL,
+            days_overdue INTEGER NOT NULL, paid INTEGER NOT NULL);
+        CREATE INDEX IF NOT EXISTS overdue_requests_user_id ON overdue_requests (user_id);
+        CREATE INDEX IF NOT EXISTS overdue_requests_book_id ON overdue_requests (book_id);
+    '''
+
+    # The statements are constants so sqlite3's per-connection statement cache reuses
+    # the prepared statement for every call
+    UPSERT_BOOK = ('INSERT INTO books (book_id, title, author, copies) VALUES (?, ?, ?, ?) '
+                   'ON CONFLICT (book_id) DO UPDATE SET title = excluded.title, author = excluded.author, copies = excluded.copies')
+    UPSERT_USER = 'INSERT INTO users (user_id, name) VALUES (?, ?) ON CONFLICT (user_id) DO UPDATE SET name = excluded.name'
+    UPSERT_LOAN = ('INSERT INTO loans (user_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?) '
+                   'ON CONFLICT (user_id, book_id) DO UPDATE SET borrow_date = excluded.borrow_date, due_date = excluded.due_date')
+    DELETE_LOAN = 'DELETE FROM loans WHERE user_id = ? AND book_id = ?'
+    INSERT_RESERVATION = 'INSERT INTO reservations (book_id, user_id) VALUES (?, ?)'
+    DELETE_RESERVATION = ('DELETE FROM reservations WHERE id = '
+                          '(SELECT id FROM reservations WHERE book_id = ? AND user_id = ? ORDER BY id LIMIT 1)')
+    INSERT_OVERDUE = 'INSERT INTO overdue_requests (user_id, book_id, days_overdue, paid) VALUES (?, ?, ?, ?)'
+    DELETE_OVERDUE = ('DELETE FROM overdue_requests WHERE id = '
+                      '(SELECT id FROM overdue_requests WHERE user_id = ? AND book_id = ? AND days_overdue = ? ORDER BY id LIMIT 1)')
+
+    def __init__(self, path='library.db', books_path='books.xlsx', users_path='users.xlsx'):
+        self.path = path
+        self.books_path = books_path
+        self.users_path = users_path
+        # Transactions are managed explicitly; the connection is shared by every thread
+        # that runs Library operations, one transaction at a time
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def transaction(self, op=None):
+        # Nested transactions join the outermost one, which commits once at the end
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute('BEGIN')
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute('ROLLBACK')
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute('COMMIT')
+
+    def load(self, library):
+        from library import Book, Loan, OverdueRequest, User
+
+        if self.conn.execute('SELECT NOT EXISTS (SELECT 1 FROM books) AND NOT EXISTS (SELECT 1 FROM users)').fetchone()[0]:
+            # First start on an empty database: migrate the workbooks into it
+            library.import_excel(self.books_path, self.users_path)
+            self.save_all(library)
+            return
+
+        library.add_books_bulk([Book(*row) for row in self.conn.execute('SELECT book_id, title, author, copies FROM books')])
+        users = {row[0]: User(*row) for row in self.conn.execute('SELECT user_id, name FROM users')}
+        books_by_id = library.books_by_id
+        for user_id, book_id, borrow_date, due_date in self.conn.execute(
+                'SELECT user_id, book_id, borrow_date, due_date FROM loans ORDER BY rowid'):
+            if user_id in users and book_id in books_by_id:
+                users[user_id].borrowed_books[book_id] = Loan(books_by_id[book_id], dates.to_ordinal(borrow_date), dates.to_ordinal(due_date))
+        library.add_users_bulk(list(users.values()))
+
+        for book_id, user_id in self.conn.execute('SELECT book_id, user_id FROM reservations ORDER BY id'):
+            if book_id in books_by_id:
+                books_by_id[book_id].add_reservation(user_id)
+        for user_id, book_id, days_overdue, paid in self.conn.execute(
+                'SELECT user_id, book_id, days_overdue, paid FROM overdue_requests ORDER BY id'):
+            if user_id in users and book_id in books_by_id:
+                request = OverdueRequest(users[user_id], books_by_id[book_id], days_overdue)
+                request.paid = bool(paid)
+                library.overdue_requests.add(request)
+
+    def save_all(self, library):
+        # Replace the whole database with the in-memory state (used for migration)
+        with self.transaction():
+            for table in ('books', 'users', 'loans', 'reservations', 'overdue_requests'):
+                self.conn.execute(f'DELETE FROM {table}')
+            self.conn.executemany(self.UPSERT_BOOK, ((book.book_id, book.title, book.author, book.copies)
+                                                     for book in library.books_by_id.values()))
+            self.conn.executemany(self.UPSERT_USER, ((user.user_id, str(user.name)) for user in library.users.values()))
+            self.conn.executemany(self.UPSERT_LOAN, ((user.user_id, loan.book.book_id, loan.borrow_date, loan.due_date)
+                                                     for user in library.users.values() for loan in user.borrowed_books.values()))
+            self.conn.executemany(self.INSERT_RESERVATION, ((book.book_id, user_id) for book in library.books_by_id.values()
+                                                            for user_id in book.reservations))
+            self.conn.executemany(self.INSERT_OVERDUE, ((request.user.user_id, request.book.book_id, request.days_overdue,
+                                                         request.paid) for request in library.overdue_requests))
+
+    def save(self, library, dirty_books=None, dirty_users=None):
+        return SaveStats()  # Every operation has already been committed
+
+    def book_saved(self, book):
+        self.conn.execute(self.UPSERT_BOOK, (book.book_id, book.title, book.author, book.copies))
+
+    def book_deleted(self, book_id):
+        self.conn.execute('DELETE FROM books WHERE book_id = ?', (book_id,))
+        self.conn.execute('DELETE FROM reservations WHERE book_id = ?', (book_id,))
+
+    def user_saved(self, user):
+        self.conn.execute(self.UPSERT_USER, (user.user_id, str(user.name)))
+
+    def user_deleted(self, user_id):
+        self.conn.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+        self.conn.execute('DELETE FROM loans WHERE user_id = ?', (user_id,))
+
+    def loan_saved(self, user_id, book_id, borrow_date, due_date):
+        self.conn.execute(self.UPSERT_LOAN, (user_id, book_id, borrow_date, due_date))
+
+    def loan_deleted(self, user_id, book_id):
+        self.conn.execute(self.DELETE_LOAN, (user_id, book_id))
+
+    def reservation_added(self, book_id, user_id):
+        self.conn.execute(self.INSERT_RESERVATION, (book_id, user_id))
+
+    def reservation_removed(self, book_id, user_id):
+        self.conn.execute(self.DELETE_RESERVATION, (book_id, user_id))
+
+    def overdue_saved(self, request):
+        self.conn.execute(self.INSERT_OVERDUE, (request.user.user_id, request.book.book_id, request.days_overdue, request.paid))
+
+    def overdue_deleted(self, request):
+        self.conn.execute(self.DELETE_OVERDUE, (request.user.user_id, request.book.book_id, request.days_overdue))
+
+    def close(self):
+        self.conn.close()
+
+
+BACKENDS = {
+    'journal': JournalBackend,
+    'snapshot': SnapshotBackend,
+    'excel': ExcelBackend,
+    'sqlite': SqliteBackend,
+}
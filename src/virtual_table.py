@@ -0,0 +1,178 @@
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+# Virtualized table for the list screens. The Treeview only ever holds the rows that
+# fit in the window; scrolling re-renders that window from the prepared rows, so a
+# table of a million books costs the same to show as one of fifty. Sorting (click a
+# heading) and filtering happen on the prepared rows in TableModel, on a worker thread,
+# and the Tk loop only polls for the result.
+
+
+def sort_key(value):
+    # Numbers sort numerically and before text; text sorts case-insensitively
+    if isinstance(value, (int, float)):
+        return (0, value, '')
+    return (1, 0, str(value).casefold())
+
+
+class TableModel:
+    # The rows behind a VirtualTable. fetch_rows returns a fresh list of row tuples from
+    # the library; prepare() filters and sorts them and page() hands out the visible slice.
+    def __init__(self, columns, fetch_rows):
+        self.columns = columns
+        self.fetch_rows = fetch_rows
+        self.rows = []
+
+    def prepare(self, sort_column=None, descending=False, filter_column=None, filter_text=''):
+        # Runs off the main loop, so it builds a new list and never touches self.rows
+        rows = self.fetch_rows()
+        needle = filter_text.strip().casefold()
+        if needle:
+            if filter_column in self.columns:
+                i = self.columns.index(filter_column)
+                rows = [row for row in rows if needle in str(row[i]).casefold()]
+            else:
+                rows = [row for row in rows if any(needle in str(value).casefold() for value in row)]
+        if sort_column in self.columns:
+            i = self.columns.index(sort_column)
+            rows.sort(key=lambda row: sort_key(row[i]), reverse=descending)
+        return rows
+
+    def page(self, start, count):
+        return self.rows[start:start + count]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class VirtualTable:
+    POLL_MS = 30       # How often the main loop checks for prepared rows
+    FILTER_DELAY_MS = 250  # Typing pause before the filter is applied
+
+    def __init__(self, parent, columns, fetch_rows, headings=None):
+        self.model = TableModel(columns, fetch_rows)
+        self.offset = 0
+        self.visible = 20
+        self.sort_column = None
+        self.descending = False
+        self.selected_index = None
+        self._generation = 0
+        self._filter_job = None
+
+        self.frame = ttk.Frame(parent)
+        toolbar = ttk.Frame(self.frame)
+        toolbar.pack(fill=tk.X)
+        ttk.Label(toolbar, text="Filter:").pack(side='left')
+        self.filter_column = ttk.Combobox(toolbar, values=("All",) + tuple(columns), state='readonly', width=12)
+        self.filter_column.set("All")
+        self.filter_column.pack(side='left', padx=5)
+        self.filter_entry = ttk.Entry(toolbar)
+        self.filter_entry.pack(side='left', padx=5)
+        self.status = ttk.Label(toolbar, text="")
+        self.status.pack(side='right')
+
+        body = ttk.Frame(self.frame)
+        body.pack(expand=True, fill=tk.BOTH, pady=10)
+        self.tree = ttk.Treeview(body, columns=columns, show='headings', selectmode='browse')
+        self.headings = dict(zip(columns, headings or columns))
+        for column in columns:
+            self.tree.heading(column, text=self.headings[column], command=lambda column=column: self.sort_by(column))
+        self.scrollbar = ttk.Scrollbar(body, orient="vertical", command=self.on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        self.tree.pack(side='left', expand=True, fill=tk.BOTH)
+
+        self.filter_entry.bind('<KeyRelease>', self.on_filter_typed)
+        self.filter_column.bind('<<ComboboxSelected>>', lambda event: self.refresh())
+        self.tree.bind('<Configure>', self.on_resize)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll_to(self.offset - event.delta // 40))
+        self.tree.bind('<Button-4>', lambda event: self.scroll_to(self.offset - 3))  # X11 wheel
+        self.tree.bind('<Button-5>', lambda event: self.scroll_to(self.offset + 3))
+        self.tree.bind('<Prior>', lambda event: self.scroll_to(self.offset - self.visible))
+        self.tree.bind('<Next>', lambda event: self.scroll_to(self.offset + self.visible))
+        self.tree.bind('<Home>', lambda event: self.scroll_to(0))
+        self.tree.bind('<End>', lambda event: self.scroll_to(len(self.model)))
+        self.refresh()
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def selected(self):
+        # Values of the selected row, or None
+        if self.selected_index is None or self.selected_index >= len(self.model):
+            return None
+        return self.model.rows[self.selected_index]
+
+    def refresh(self):
+        # Re-reads the rows from the library and re-applies the sort and filter in the background
+        self._generation += 1
+        generation = self._generation
+        options = (self.sort_column, self.descending, self.filter_column.get(), self.filter_entry.get())
+        self.status.configure(text="Loading...")
+        result = []  # Filled by the worker; list.append is atomic, so no lock is needed
+
+        def work():
+            result.append(self.model.prepare(*options))
+
+        threading.Thread(target=work, name='table-prepare', daemon=True).start()
+        self.frame.after(self.POLL_MS, self._poll, generation, result)
+
+    def _poll(self, generation, result):
+        if generation != self._generation or not self.tree.winfo_exists():
+            return  # A newer refresh is running, or the screen is gone
+        if not result:
+            self.frame.after(self.POLL_MS, self._poll, generation, result)
+            return
+        self.model.rows = result[0]
+        self.selected_index = None
+        self.status.configure(text=f"{len(self.model):,} rows")
+        self.scroll_to(0)
+
+    def sort_by(self, column):
+        self.descending = not self.descending if column == self.sort_column else False
+        self.sort_column = column
+        for name, text in self.headings.items():
+            arrow = (" ▼" if self.descending else " ▲") if name == column else ""
+            self.tree.heading(name, text=text + arrow)
+        self.refresh()
+
+    def on_filter_typed(self, event):
+        if self._filter_job:
+            self.frame.after_cancel(self._filter_job)
+        self._filter_job = self.frame.after(self.FILTER_DELAY_MS, self.refresh)
+
+    def on_resize(self, event):
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        visible = max(1, event.height // row_height - 1)  # One row's worth goes to the headings
+        if visible != self.visible:
+            self.visible = visible
+            self.scroll_to(self.offset)
+
+    def on_select(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self.selected_index = int(selection[0])
+
+    def on_scroll(self, action, amount, unit=None):
+        # Scrollbar protocol: ('moveto', fraction) or ('scroll', n, 'units' | 'pages')
+        if action == 'moveto':
+            self.scroll_to(int(float(amount) * len(self.model)))
+        elif unit == 'pages':
+            self.scroll_to(self.offset + int(amount) * self.visible)
+        else:
+            self.scroll_to(self.offset + int(amount))
+
+    def scroll_to(self, offset):
+        total = len(self.model)
+        self.offset = max(0, min(offset, total - self.visible))
+        self.tree.delete(*self.tree.get_children())
+        for i, row in enumerate(self.model.page(self.offset, self.visible), start=self.offset):
+            self.tree.insert('', 'end', iid=str(i), values=row)
+        if self.selected_index is not None and self.tree.exists(str(self.selected_index)):
+            self.tree.selection_set(str(self.selected_index))
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        return 'break'